@@ -0,0 +1,100 @@
+"""
+Admission Helper Module for shedding load onto the cheap fallback paths
+Tracks in-flight work per stage and current queue wait, and decides when to skip the expensive path.
+"""
+
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Default thresholds; override with SHED_<STAGE>_MAX_INFLIGHT / SHED_<STAGE>_MAX_QUEUE_WAIT_MS
+# (0 disables that check)
+DEFAULT_THRESHOLDS = {
+    "llm": {"max_inflight": 64, "max_queue_wait_ms": 10000},
+    "github": {"max_inflight": 64, "max_queue_wait_ms": 10000},
+}
+
+
+class AdmissionHelper:
+    def __init__(self, wait_sources: Optional[Dict[str, Callable[[], float]]] = None):
+        """
+        `wait_sources` maps a stage to a callable returning its current queue
+        wait in milliseconds, i.e. how long the oldest still-queued call has
+        waited (e.g. from the executor pool metrics).
+        """
+        self.wait_sources = wait_sources or {}
+        self.thresholds: Dict[str, Dict[str, float]] = {}
+        for stage, defaults in DEFAULT_THRESHOLDS.items():
+            prefix = f"SHED_{stage.upper()}"
+            self.thresholds[stage] = {
+                "max_inflight": int(os.getenv(f"{prefix}_MAX_INFLIGHT", str(defaults["max_inflight"]))),
+                "max_queue_wait_ms": float(os.getenv(f"{prefix}_MAX_QUEUE_WAIT_MS", str(defaults["max_queue_wait_ms"]))),
+            }
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, int] = {stage: 0 for stage in DEFAULT_THRESHOLDS}
+        self._admitted: Dict[str, int] = {stage: 0 for stage in DEFAULT_THRESHOLDS}
+        self._shed: Dict[str, int] = {stage: 0 for stage in DEFAULT_THRESHOLDS}
+
+    def _queue_wait_ms(self, stage: str) -> float:
+        source = self.wait_sources.get(stage)
+        if source is None:
+            return 0.0
+        try:
+            return float(source())
+        except Exception as e:
+            logger.warning(f"Queue wait source for {stage} failed: {e}")
+            return 0.0
+
+    def check(self, stage: str) -> Optional[str]:
+        """
+        Return a reason string when new `stage` work should be shed, else None.
+        A shed decision is counted; an admitted one is not until track() runs.
+        """
+        limits = self.thresholds.get(stage)
+        if not limits:
+            return None
+        with self._lock:
+            inflight = self._inflight.get(stage, 0)
+        reason = None
+        if limits["max_inflight"] > 0 and inflight >= limits["max_inflight"]:
+            reason = f"{stage} at capacity ({inflight} in flight, limit {limits['max_inflight']})"
+        else:
+            wait_ms = self._queue_wait_ms(stage)
+            if limits["max_queue_wait_ms"] > 0 and wait_ms >= limits["max_queue_wait_ms"]:
+                reason = f"{stage} queue wait {wait_ms:.0f}ms over limit {limits['max_queue_wait_ms']:.0f}ms"
+        if reason:
+            with self._lock:
+                self._shed[stage] = self._shed.get(stage, 0) + 1
+            logger.warning(f"Shedding load: {reason}")
+        return reason
+
+    @contextmanager
+    def track(self, stage: str):
+        """Count a unit of admitted `stage` work as in flight for the duration of the block"""
+        with self._lock:
+            self._inflight[stage] = self._inflight.get(stage, 0) + 1
+            self._admitted[stage] = self._admitted.get(stage, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight[stage] -= 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                stage: {
+                    "inflight": self._inflight.get(stage, 0),
+                    "admitted": self._admitted.get(stage, 0),
+                    "shed": self._shed.get(stage, 0),
+                    "queue_wait_ms": round(self._queue_wait_ms(stage), 2),
+                    **limits,
+                }
+                for stage, limits in self.thresholds.items()
+            }
@@ -4,19 +4,31 @@ Automates app building and deployment using LLMs and GitHub Pages
 """
 
 import os
+import json
+import asyncio
 import logging
-from typing import Dict, Any, Optional
+import functools
+import threading
+from typing import Dict, Any, Optional, List, Callable, Tuple
 from datetime import datetime
 
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Header, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
 
-from llm_helper import LLMHelper, AppGenerationRequest
+from llm_helper import LLMHelper, AppGenerationRequest, GeneratedApp
 from github_helper import GitHubHelper
 from deploy_helper import DeployHelper
+from executor_helper import ExecutorHelper
+from job_helper import JobHelper
+from db_helper import DBHelper
+from deadline_helper import Deadline, DeadlineExceeded
+from admission_helper import AdmissionHelper
+from template_helper import TemplateHelper
+from artifact_helper import ArtifactStore
+from repo_index_helper import RepoIndex
 
 # Load environment variables
 load_dotenv()
@@ -50,32 +62,120 @@ app.add_middleware(
 llm_helper = None
 github_helper = None
 deploy_helper = None
+executor_helper = None
+job_helper = None
+admission_helper = None
+template_helper = None
+artifact_store = None
+repo_index = None
+# Helpers are first requested from executor threads as well as the event loop; the lock makes sure
+# each is built once (re-entrant because some getters build the helpers they depend on)
+_helpers_lock = threading.RLock()
 
 
 def get_llm_helper() -> LLMHelper:
     global llm_helper
     if llm_helper is None:
-        logger.info("Initializing LLMHelper...")
-        llm_helper = LLMHelper()
+        with _helpers_lock:
+            if llm_helper is None:
+                logger.info("Initializing LLMHelper...")
+                llm_helper = LLMHelper()
     return llm_helper
 
 
 def get_github_helper() -> GitHubHelper:
     global github_helper
     if github_helper is None:
-        logger.info("Initializing GitHubHelper...")
-        github_helper = GitHubHelper()
+        with _helpers_lock:
+            if github_helper is None:
+                logger.info("Initializing GitHubHelper...")
+                github_helper = GitHubHelper()
     return github_helper
 
 
 def get_deploy_helper() -> DeployHelper:
     global deploy_helper
     if deploy_helper is None:
-        logger.info("Initializing DeployHelper...")
-        deploy_helper = DeployHelper()
+        with _helpers_lock:
+            if deploy_helper is None:
+                logger.info("Initializing DeployHelper...")
+                deploy_helper = DeployHelper()
     return deploy_helper
 
 
+def get_executor_helper() -> ExecutorHelper:
+    global executor_helper
+    if executor_helper is None:
+        with _helpers_lock:
+            if executor_helper is None:
+                logger.info("Initializing ExecutorHelper...")
+                executor_helper = ExecutorHelper()
+    return executor_helper
+
+
+def get_job_helper() -> JobHelper:
+    global job_helper
+    if job_helper is None:
+        with _helpers_lock:
+            if job_helper is None:
+                logger.info("Initializing JobHelper...")
+                store = None
+                try:
+                    store = DBHelper()
+                except Exception as e:
+                    logger.error(f"Job store unavailable, jobs will not survive restarts: {e}")
+                job_helper = JobHelper(store=store)
+    return job_helper
+
+
+def get_admission_helper() -> AdmissionHelper:
+    global admission_helper
+    if admission_helper is None:
+        with _helpers_lock:
+            if admission_helper is None:
+                logger.info("Initializing AdmissionHelper...")
+                admission_helper = AdmissionHelper(wait_sources={
+                    # Age of the oldest call still queued: drops back to 0 as soon as the queue drains,
+                    # unlike a moving average of past waits that shed requests would never update
+                    "llm": lambda: max(
+                        get_executor_helper().get_stage_metrics("llm")["oldest_wait_ms"],
+                        1000 * get_llm_helper().oldest_wait()
+                    ),
+                    "github": lambda: get_executor_helper().get_stage_metrics("github")["oldest_wait_ms"],
+                })
+    return admission_helper
+
+
+def get_template_helper() -> TemplateHelper:
+    global template_helper
+    if template_helper is None:
+        with _helpers_lock:
+            if template_helper is None:
+                logger.info("Initializing TemplateHelper...")
+                template_helper = TemplateHelper()
+    return template_helper
+
+
+def get_artifact_store() -> ArtifactStore:
+    global artifact_store
+    if artifact_store is None:
+        with _helpers_lock:
+            if artifact_store is None:
+                logger.info("Initializing ArtifactStore...")
+                artifact_store = ArtifactStore(store=get_job_helper().store)
+    return artifact_store
+
+
+def get_repo_index() -> RepoIndex:
+    global repo_index
+    if repo_index is None:
+        with _helpers_lock:
+            if repo_index is None:
+                logger.info("Initializing RepoIndex...")
+                repo_index = RepoIndex(store=get_job_helper().store)
+    return repo_index
+
+
 class TaskRequest(BaseModel):
     email: str = Field(..., description="User email address")
     secret: str = Field(..., description="Shared secret for authentication")
@@ -86,6 +186,7 @@ class TaskRequest(BaseModel):
     evaluation_url: str = Field(..., description="URL to send evaluation data")
     attachments: Optional[list] = Field(default=None, description="Additional attachments or context")
     return_code: Optional[bool] = Field(default=False, description="If true, include generated code in response")
+    async_mode: Optional[bool] = Field(default=False, description="If true, return a job id immediately and process in the background")
 
     @field_validator('secret', mode='before')
     @classmethod
@@ -115,6 +216,16 @@ class EvaluationRequest(BaseModel):
     timestamp: Optional[str] = Field(default=None, description="Evaluation timestamp")
 
 
+class BatchTaskRequest(BaseModel):
+    requests: List[TaskRequest] = Field(..., description="Tasks to process")
+    concurrency: Optional[int] = Field(default=None, description="Max tasks processed at once (default BATCH_CONCURRENCY)")
+    stream: Optional[bool] = Field(default=False, description="If true, stream per-item results as NDJSON as they finish")
+
+
+class JobStatusRequest(BaseModel):
+    job_ids: List[str] = Field(..., description="Job ids returned by /api/request in async mode")
+
+
 class HealthResponse(BaseModel):
     status: str
     timestamp: str
@@ -141,8 +252,9 @@ async def health_check():
 
 def _fallback_generated_app(task: str) -> dict:
     title = f"{task or 'LLM App'}"
-    html = f"""<!doctype html><html><head><meta charset=\"utf-8\"><title>{title}</title><link rel=\"stylesheet\" href=\"styles.css\"></head><body><div id=\"app\"><h1>{title}</h1><p>Your app was generated in fallback mode.</p><script src=\"script.js\"></script></div></body></html>"""
-    css = "body{font-family:system-ui,Segoe UI,Arial,sans-serif;margin:40px;background:#fafafa;color:#222}#app{max-width:800px;margin:auto;padding:24px;border:1px solid #e5e5e5;border-radius:12px;background:#fff}h1{margin-top:0}"
+    templates = get_template_helper()
+    html = templates.render("fallback.html", title=title)
+    css = templates.render("fallback.css")
     js = "console.log('Fallback app initialized');"
     metadata = {"title": title, "description": "Fallback generated application"}
     return {"html_content": html, "css_content": css, "js_content": js, "metadata": metadata}
@@ -173,149 +285,680 @@ def _local_repo_deploy(app_name: str, html: str, css: str, js: str, metadata: Di
     }
 
 
-@app.post("/api/request")
-async def process_request(request: TaskRequest):
+@app.get("/api/metrics")
+async def get_metrics():
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "timestamp": datetime.utcnow().isoformat(),
+            "executor": get_executor_helper().get_metrics(),
+            "llm": get_llm_helper().get_metrics(),
+            "jobs": get_job_helper().get_metrics(),
+            "admission": get_admission_helper().get_metrics(),
+            "scheduler": get_job_helper().scheduler.get_metrics(),
+            # Not created just for metrics: it needs GitHub credentials
+            "github": github_helper.get_metrics() if github_helper is not None else None
+        }
+    )
+
+
+def _emit(on_event: Optional[Callable[..., None]], stage: str, stage_status: str, **detail):
+    """Report pipeline progress to an optional listener; never let it break the pipeline"""
+    if on_event is None:
+        return
     try:
-        logger.info(f"Processing request for {request.email}, round {request.round}")
+        on_event(stage, stage_status, **detail)
+    except Exception as e:
+        logger.warning(f"Progress listener failed for stage {stage}: {e}")
 
-        errors: list[str] = []
-        # Step 1: Generate app using LLM (with fallback)
-        logger.info("Generating application with LLM...")
-        try:
-            app_request = AppGenerationRequest(
-                task=request.task,
-                brief=request.brief,
-                round=request.round,
-                attachments=request.attachments
+
+def _async_llm_enabled() -> bool:
+    return os.getenv("LLM_ASYNC", "true").lower() == "true"
+
+
+def _fallback_app(task: str) -> GeneratedApp:
+    return GeneratedApp(**_fallback_generated_app(task))
+
+
+def _generate_without_llm(app_request: AppGenerationRequest) -> Tuple[Optional[GeneratedApp], Optional[str]]:
+    """A deterministic builder's app or a cached LLM response, and which one it was; (None, None) if neither"""
+    llm = get_llm_helper()
+    deterministic = llm.generate_deterministic(app_request)
+    if deterministic is not None:
+        return deterministic, "deterministic builder"
+    cached = llm.cached_app(app_request)
+    if cached is not None:
+        return cached, "cached response"
+    return None, None
+
+
+async def _generate_stage(
+    request: TaskRequest,
+    errors: list,
+    on_event: Optional[Callable[..., None]] = None,
+    deadline: Optional[Deadline] = None
+) -> Tuple[GeneratedApp, bool, bool]:
+    """
+    Step 1: generate the app with the LLM; returns (app, used_fallback, shed).
+    Under overload the LLM is skipped for a deterministic builder or the fallback app.
+    """
+    logger.info("Generating application with LLM...")
+    _emit(on_event, "generation", "started")
+    try:
+        timeout = deadline.stage_timeout("generation") if deadline else None
+        app_request = AppGenerationRequest(
+            task=request.task,
+            brief=request.brief,
+            round=request.round,
+            attachments=request.attachments
+        )
+        if request.round > 1:
+            previous = await asyncio.get_running_loop().run_in_executor(
+                None, get_artifact_store().get_previous, request.email, request.task, request.round
             )
-            generated_app = get_llm_helper().generate_app(app_request)
-            if not get_llm_helper().validate_generated_app(generated_app):
-                errors.append("Generated app failed validation; using fallback content")
-                fa = _fallback_generated_app(request.task)
-                class _Obj: pass
-                generated_app = _Obj()
-                generated_app.html_content = fa["html_content"]
-                generated_app.css_content = fa["css_content"]
-                generated_app.js_content = fa["js_content"]
-                generated_app.metadata = fa["metadata"]
-        except Exception as e:
-            errors.append(f"LLM generation error: {e}")
-            fa = _fallback_generated_app(request.task)
-            class _Obj: pass
-            generated_app = _Obj()
-            generated_app.html_content = fa["html_content"]
-            generated_app.css_content = fa["css_content"]
-            generated_app.js_content = fa["js_content"]
-            generated_app.metadata = fa["metadata"]
-
-        # Step 2: Deploy to GitHub
-        logger.info("Deploying to GitHub...")
-        repo_data = None
-        try:
-            # Pass extra files via metadata for GitHub helper
-            extra_files = getattr(generated_app, 'extra_files', None)
-            if isinstance(generated_app.metadata, dict) and extra_files:
-                generated_app.metadata["_extra_files"] = extra_files
-            repo_data = get_github_helper().create_repo_and_deploy(
+            if previous:
+                logger.info(f"Revising round {previous['round']} files of {request.task}")
+                app_request.prior_files = previous["files"]
+        admission = get_admission_helper()
+        shed_reason = admission.check("llm")
+        if shed_reason:
+            offline, source = await asyncio.get_running_loop().run_in_executor(
+                None, _generate_without_llm, app_request
+            )
+            if offline is not None:
+                errors.append(f"Load shed ({shed_reason}); used {source}")
+                _emit(on_event, "generation", "completed", shed=True, deterministic=source == "deterministic builder")
+                return offline, False, True
+            errors.append(f"Load shed ({shed_reason}); using fallback content")
+            _emit(on_event, "generation", "skipped", shed=True, reason=shed_reason)
+            return _fallback_app(request.task), True, True
+        llm = get_llm_helper()
+        if llm.circuit_open():
+            # Provider is failing: don't queue behind calls that would fail fast anyway
+            offline, source = await asyncio.get_running_loop().run_in_executor(
+                None, _generate_without_llm, app_request
+            )
+            if offline is not None:
+                errors.append(f"LLM circuit open; used {source}")
+                _emit(on_event, "generation", "completed", deterministic=source == "deterministic builder")
+                return offline, False, False
+            errors.append("LLM circuit open; using fallback content")
+            _emit(on_event, "generation", "skipped", reason="circuit open")
+            return _fallback_app(request.task), True, False
+        with admission.track("llm"):
+            if _async_llm_enabled() and llm.supports_async:
+                streamed_fields: List[str] = []
+
+                def on_field(field: str):
+                    # Hedged attempts may each report the same field
+                    if field not in streamed_fields:
+                        streamed_fields.append(field)
+                        _emit(on_event, "generation", "streaming", fields=list(streamed_fields))
+
+                generation = llm.agenerate_app(app_request, timeout=timeout, on_field=on_field)
+            else:
+                # Blocking OpenAI SDK call runs on the "llm" pool so the event loop stays free
+                generation = get_executor_helper().run(
+                    "llm", lambda: llm.generate_app(app_request, timeout=timeout)
+                )
+            generated_app = await asyncio.wait_for(generation, timeout)
+        _emit(on_event, "generation", "completed")
+        valid = get_llm_helper().validate_generated_app(generated_app)
+        _emit(on_event, "validation", "completed", passed=valid)
+        if not valid:
+            errors.append("Generated app failed validation; using fallback content")
+            return _fallback_app(request.task), True, False
+        return generated_app, False, False
+    except (asyncio.TimeoutError, DeadlineExceeded) as e:
+        errors.append("Request deadline exceeded during generation; using fallback content")
+        _emit(on_event, "generation", "failed", error=f"deadline exceeded: {e}")
+        return _fallback_app(request.task), True, False
+    except Exception as e:
+        errors.append(f"LLM generation error: {e}")
+        _emit(on_event, "generation", "failed", error=str(e))
+        return _fallback_app(request.task), True, False
+
+
+def _overlap_repo_creation_enabled() -> bool:
+    return os.getenv("PIPELINE_OVERLAP_REPO", "true").lower() == "true"
+
+
+def _start_repo_preparation(request: TaskRequest) -> "asyncio.Future":
+    """Create the target repository (and resolve the owner) while generation runs"""
+    return asyncio.ensure_future(
+        get_executor_helper().run("github", lambda: get_github_helper().prepare_repository(request.task))
+    )
+
+
+_background_tasks: set = set()
+
+
+def _spawn_background(coro) -> "asyncio.Task":
+    """Run a coroutine after the response without letting it be garbage collected"""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _delete_prepared_repo(prepared_repo: "asyncio.Future"):
+    """Clean up a pre-created repository that the pipeline will not deploy to"""
+    try:
+        repo = await prepared_repo
+    except (Exception, asyncio.CancelledError):
+        # Failed, or cancelled before a worker picked it up: no repository was created
+        return
+    try:
+        await get_executor_helper().run("github", lambda: get_github_helper().delete_repository(repo))
+    except Exception as e:
+        logger.error(f"Failed to clean up prepared repository: {e}")
+
+
+async def _deploy_stage(
+    request: TaskRequest,
+    generated_app: GeneratedApp,
+    errors: list,
+    on_event: Optional[Callable[..., None]] = None,
+    prepared_repo: Optional["asyncio.Future"] = None,
+    deadline: Optional[Deadline] = None,
+    shed_reason: Optional[str] = None,
+    indexed_repo: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Step 2: deploy to GitHub, falling back to a local deployment. A repository
+    pre-created during generation is reused, including for fallback content,
+    and deleted if the GitHub deployment does not succeed. With a shed_reason
+    the GitHub deploy is skipped and the app is deployed locally. Revisions of
+    an indexed task update its repository in place, and every GitHub deploy
+    is recorded in the repo index.
+    """
+    logger.info("Deploying to GitHub...")
+    _emit(on_event, "deployment", "started")
+    # Pass extra files via metadata for GitHub helper
+    extra_files = getattr(generated_app, 'extra_files', None)
+    if isinstance(generated_app.metadata, dict) and extra_files:
+        generated_app.metadata["_extra_files"] = extra_files
+
+    # GitHub progress arrives on a worker thread; hop back onto the loop before emitting
+    loop = asyncio.get_running_loop()
+    progress = lambda stage, stage_status, **detail: loop.call_soon_threadsafe(
+        functools.partial(_emit, on_event, stage, stage_status, **detail)
+    )
+
+    async def _github_deploy() -> Dict[str, Any]:
+        repo = None
+        if prepared_repo is not None:
+            try:
+                # Shielded: a deadline cancelling this deploy must not cancel the preparation, whose
+                # worker thread would still create the repo with nobody left to delete it
+                repo = await asyncio.shield(prepared_repo)
+                _emit(on_event, "repository", "completed", repo_name=repo.name, prepared=True)
+            except Exception as e:
+                logger.warning(f"Repository pre-creation failed; creating during deploy: {e}")
+        return await get_executor_helper().run(
+            "github",
+            lambda: get_github_helper().create_repo_and_deploy(
                 app_name=request.task,
                 html_content=generated_app.html_content,
                 css_content=generated_app.css_content,
                 js_content=generated_app.js_content,
                 metadata=generated_app.metadata,
-                is_revision=(request.round > 1)
+                is_revision=(request.round > 1),
+                existing_repo_name=indexed_repo["repo_name"] if indexed_repo else None,
+                repo=repo,
+                on_progress=progress if on_event is not None else None,
+                known_tree=indexed_repo
             )
-        except Exception as e:
-            errors.append(f"GitHub helper init/deploy error: {e}")
-            repo_data = {"success": False, "error": str(e)}
-
-        if not repo_data or not repo_data.get("success"):
-            if repo_data and repo_data.get("error"):
-                errors.append(f"GitHub deployment failed: {repo_data.get('error')}")
-            # Local fallback deployment
-            repo_data = _local_repo_deploy(
-                app_name=request.task,
-                html=generated_app.html_content,
-                css=generated_app.css_content,
-                js=generated_app.js_content,
-                metadata=generated_app.metadata,
+        )
+
+    repo_data = None
+    try:
+        if shed_reason:
+            errors.append(f"Load shed ({shed_reason}); using local deployment")
+            repo_data = {"success": False}
+        else:
+            timeout = deadline.stage_timeout("deployment") if deadline else None
+            with get_admission_helper().track("github"):
+                repo_data = await asyncio.wait_for(_github_deploy(), timeout)
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        errors.append("Request deadline exceeded during GitHub deployment; using local deployment")
+        repo_data = {"success": False}
+    except Exception as e:
+        errors.append(f"GitHub helper init/deploy error: {e}")
+        repo_data = {"success": False, "error": str(e)}
+
+    if repo_data and repo_data.get("success"):
+        get_repo_index().save(request.email, request.task, {
+            "repo_name": repo_data.get("repo_name"),
+            "commit_sha": repo_data.get("commit_sha"),
+            "tree_sha": repo_data.get("tree_sha"),
+            "files": repo_data.pop("tree_files", None) or {},
+        })
+    if not repo_data or not repo_data.get("success"):
+        if repo_data and repo_data.get("error"):
+            errors.append(f"GitHub deployment failed: {repo_data.get('error')}")
+        if prepared_repo is not None:
+            _spawn_background(_delete_prepared_repo(prepared_repo))
+        # Local fallback deployment
+        repo_data = _local_repo_deploy(
+            app_name=request.task,
+            html=generated_app.html_content,
+            css=generated_app.css_content,
+            js=generated_app.js_content,
+            metadata=generated_app.metadata,
+        )
+    _emit(
+        on_event, "deployment", "completed",
+        repo_name=repo_data.get("repo_name"),
+        pages_url=repo_data.get("pages_url"),
+        fallback=repo_data.get("fallback", False)
+    )
+    return repo_data
+
+
+async def _notify_stage(
+    request: TaskRequest,
+    generated_app: GeneratedApp,
+    repo_data: Dict[str, Any],
+    errors: list,
+    on_event: Optional[Callable[..., None]] = None,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """
+    Step 3: notify the evaluation API. When the request deadline leaves no time
+    for it, the notification is sent in the background after responding.
+    """
+    logger.info("Notifying evaluation API...")
+    evaluation_result = {"success": False}
+    try:
+        if request.evaluation_url and isinstance(request.evaluation_url, str) and (
+            request.evaluation_url.startswith("http://") or request.evaluation_url.startswith("https://")
+        ):
+            notify = lambda timeout=None: get_deploy_helper().notify_evaluation_api(
+                evaluation_url=request.evaluation_url,
+                email=request.email,
+                task=request.task,
+                round_num=request.round,
+                nonce=request.nonce,
+                repo_data=repo_data,
+                app_metadata=generated_app.metadata,
+                timeout=timeout
+            )
+            try:
+                timeout = deadline.stage_timeout("evaluation") if deadline else None
+            except DeadlineExceeded:
+                _spawn_background(notify())
+                errors.append("Request deadline exhausted; evaluation notification deferred to background")
+                _emit(on_event, "evaluation", "skipped", reason="deferred: deadline exhausted")
+                return {"success": False, "error": "Deferred: request deadline exhausted"}
+            _emit(on_event, "evaluation", "started")
+            evaluation_result = await notify(timeout)
+            _emit(
+                on_event, "evaluation", "completed",
+                sent=evaluation_result.get("success", False),
+                status_code=evaluation_result.get("status_code")
             )
+        else:
+            _emit(on_event, "evaluation", "skipped", reason="No valid evaluation_url")
+    except Exception as e:
+        errors.append(f"Evaluation notify failed: {e}")
+        _emit(on_event, "evaluation", "failed", error=str(e))
+    return evaluation_result
 
-        # Step 3: Notify evaluation API
-        logger.info("Notifying evaluation API...")
-        evaluation_result = {"success": False}
-        try:
-            if request.evaluation_url and isinstance(request.evaluation_url, str) and (
-                request.evaluation_url.startswith("http://") or request.evaluation_url.startswith("https://")
-            ):
-                evaluation_result = await get_deploy_helper().notify_evaluation_api(
-                    evaluation_url=request.evaluation_url,
-                    email=request.email,
-                    task=request.task,
-                    round_num=request.round,
-                    nonce=request.nonce,
-                    repo_data=repo_data,
-                    app_metadata=generated_app.metadata
-                )
-        except Exception as e:
-            errors.append(f"Evaluation notify failed: {e}")
 
-        response_data = {
-            "success": True,
-            "message": "Application generated and deployed successfully",
-            "deployment": {
-                "repo_name": repo_data.get("repo_name"),
-                "repo_url": repo_data.get("repo_url"),
-                "commit_sha": repo_data.get("commit_sha"),
-                "pages_url": repo_data.get("pages_url")
-            },
-            "evaluation_notification": {
-                "sent": evaluation_result.get("success", False),
-                "status_code": evaluation_result.get("status_code"),
-                "error": evaluation_result.get("error") if not evaluation_result.get("success") else None
-            },
-            "metadata": {
-                "round": request.round,
-                "nonce": request.nonce,
-                "timestamp": datetime.utcnow().isoformat()
-            },
-            "errors": errors,
-            "fallback": repo_data.get("fallback", False)
+async def _run_pipeline(
+    request: TaskRequest,
+    on_event: Optional[Callable[..., None]] = None,
+    job_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    resume: bool = False
+) -> Dict[str, Any]:
+    """
+    Generate, deploy and notify for one TaskRequest and return the response body.
+    Stage progress is reported through on_event(stage, status, **detail). With a
+    job_id, each finished stage is persisted; with resume (a recovered job),
+    already-finished stages are loaded from the job store instead of being run
+    again. A deadline shares one latency budget across the stages, switching
+    to the fallback paths when a stage runs out of time.
+    """
+    logger.info(f"Processing request for {request.email}, round {request.round}")
+    jobs = get_job_helper()
+    loop = asyncio.get_running_loop()
+    # Only a recovered job can have stored stages; the store read stays off the event loop
+    stored = await loop.run_in_executor(None, jobs.get_stage_results, job_id) if job_id and resume else {}
+    errors: list[str] = []
+
+    # Decide up front whether GitHub is overloaded, so no repository is created for a shed deploy
+    deploy_shed_reason = get_admission_helper().check("github") if "deployment" not in stored else None
+    shed = False
+
+    # Revisions of an already deployed task update its repository instead of creating one
+    indexed_repo = None
+    if request.round > 1:
+        indexed_repo = await loop.run_in_executor(None, get_repo_index().get, request.email, request.task)
+
+    # Repository creation only needs the task name, so overlap it with generation
+    prepared_repo = None
+    if (
+        "generation" not in stored and "deployment" not in stored and indexed_repo is None
+        and not deploy_shed_reason and _overlap_repo_creation_enabled()
+    ):
+        prepared_repo = _start_repo_preparation(request)
+
+    try:
+        if "generation" in stored:
+            logger.info(f"Resuming job {job_id}: reusing generated app")
+            generated_app = GeneratedApp(**stored["generation"]["app"])
+            errors = list(stored["generation"].get("errors", []))
+            shed = stored["generation"].get("shed", False)
+            _emit(on_event, "generation", "completed", resumed=True)
+        else:
+            generated_app, used_fallback_app, shed = await _generate_stage(
+                request, errors, on_event, deadline=deadline
+            )
+            if job_id:
+                jobs.save_stage_result(job_id, "generation", {
+                    "app": generated_app.model_dump(),
+                    "fallback_app": used_fallback_app,
+                    "shed": shed,
+                    "errors": list(errors),
+                })
+            if not used_fallback_app:
+                get_artifact_store().save(request.email, request.task, request.round, {
+                    "index.html": generated_app.html_content,
+                    "styles.css": generated_app.css_content,
+                    "script.js": generated_app.js_content,
+                })
+    except BaseException:
+        if prepared_repo is not None:
+            _spawn_background(_delete_prepared_repo(prepared_repo))
+        raise
+
+    if "deployment" in stored:
+        logger.info(f"Resuming job {job_id}: reusing deployment")
+        repo_data = stored["deployment"]["repo_data"]
+        errors = list(stored["deployment"].get("errors", errors))
+        _emit(on_event, "deployment", "completed", resumed=True, repo_name=repo_data.get("repo_name"))
+    else:
+        repo_data = await _deploy_stage(
+            request, generated_app, errors, on_event,
+            prepared_repo=prepared_repo, deadline=deadline, shed_reason=deploy_shed_reason,
+            indexed_repo=indexed_repo
+        )
+        if job_id:
+            jobs.save_stage_result(job_id, "deployment", {"repo_data": repo_data, "errors": list(errors)})
+
+    if "evaluation" in stored:
+        evaluation_result = stored["evaluation"]["evaluation_result"]
+        errors = list(stored["evaluation"].get("errors", errors))
+        _emit(on_event, "evaluation", "completed", resumed=True)
+    else:
+        evaluation_result = await _notify_stage(request, generated_app, repo_data, errors, on_event, deadline=deadline)
+        if job_id:
+            jobs.save_stage_result(job_id, "evaluation", {"evaluation_result": evaluation_result, "errors": list(errors)})
+
+    response_data = {
+        "success": True,
+        "message": "Application generated and deployed successfully",
+        "deployment": {
+            "repo_name": repo_data.get("repo_name"),
+            "repo_url": repo_data.get("repo_url"),
+            "commit_sha": repo_data.get("commit_sha"),
+            "pages_url": repo_data.get("pages_url")
+        },
+        "evaluation_notification": {
+            "sent": evaluation_result.get("success", False),
+            "status_code": evaluation_result.get("status_code"),
+            "error": evaluation_result.get("error") if not evaluation_result.get("success") else None
+        },
+        "metadata": {
+            "round": request.round,
+            "nonce": request.nonce,
+            "timestamp": datetime.utcnow().isoformat()
+        },
+        "errors": errors,
+        # Load-shed requests are reported as fallback even when the deploy itself succeeded
+        "fallback": repo_data.get("fallback", False) or shed
+    }
+    if job_id:
+        response_data["metadata"]["job_id"] = job_id
+    if deadline is not None and deadline.budget is not None:
+        response_data["metadata"]["deadline"] = deadline.to_dict()
+
+    if getattr(request, "return_code", False):
+        response_data["code"] = {
+            "html_content": generated_app.html_content,
+            "css_content": generated_app.css_content,
+            "js_content": generated_app.js_content,
+            "metadata": generated_app.metadata
         }
 
-        if getattr(request, "return_code", False):
-            response_data["code"] = {
-                "html_content": generated_app.html_content,
-                "css_content": generated_app.css_content,
-                "js_content": generated_app.js_content,
-                "metadata": generated_app.metadata
-            }
+    logger.info(f"Request completed successfully for {request.email}")
+    logger.info(get_deploy_helper().format_deployment_summary(repo_data, generated_app.metadata))
+    return response_data
 
-        logger.info(f"Request completed successfully for {request.email}")
-        logger.info(get_deploy_helper().format_deployment_summary(repo_data, generated_app.metadata))
 
-        return JSONResponse(status_code=status.HTTP_200_OK, content=response_data)
+def _fallback_response(error: Exception) -> Dict[str, Any]:
+    """Last-resort response body used when the pipeline itself raises"""
+    fa = _fallback_generated_app("App")
+    repo_data = _local_repo_deploy("App", fa["html_content"], fa["css_content"], fa["js_content"], fa["metadata"])
+    return {
+        "success": True,
+        "message": "Application generated and deployed (fallback)",
+        "deployment": {
+            "repo_name": repo_data.get("repo_name"),
+            "repo_url": repo_data.get("repo_url"),
+            "commit_sha": repo_data.get("commit_sha"),
+            "pages_url": repo_data.get("pages_url")
+        },
+        "evaluation_notification": {"sent": False},
+        "metadata": {"round": 1, "nonce": "fallback", "timestamp": datetime.utcnow().isoformat()},
+        "errors": [str(error)],
+        "fallback": True
+    }
+
+
+def _request_info(request: TaskRequest) -> Dict[str, Any]:
+    return {"email": request.email, "task": request.task, "round": request.round, "nonce": request.nonce}
+
+
+def _request_payload(request: TaskRequest) -> Dict[str, Any]:
+    """Full request persisted for crash recovery (the shared secret is not stored)"""
+    return request.model_dump(exclude={"secret"})
+
+
+def _dedup_key(request: TaskRequest) -> Tuple[str, str, int, str]:
+    return (request.email, request.task, request.round, request.nonce)
+
+
+async def _run_job(
+    request: TaskRequest,
+    job_id: str,
+    deadline: Optional[Deadline] = None,
+    resume: bool = False
+) -> Dict[str, Any]:
+    jobs = get_job_helper()
+    try:
+        return await _run_pipeline(
+            request,
+            on_event=lambda stage, stage_status, **detail: jobs.record_stage(job_id, stage, stage_status, **detail),
+            job_id=job_id,
+            deadline=deadline,
+            resume=resume
+        )
     except Exception as e:
-        # Last-resort response to comply with "always 200"
-        logger.error(f"Unexpected error processing request (responding 200 per policy): {e}")
-        fa = _fallback_generated_app("App")
-        repo_data = _local_repo_deploy("App", fa["html_content"], fa["css_content"], fa["js_content"], fa["metadata"])
+        logger.error(f"Unexpected error in job {job_id} (completing with fallback): {e}")
+        return _fallback_response(e)
+
+
+@app.post("/api/request")
+async def process_request(request: TaskRequest, x_request_deadline: Optional[str] = Header(default=None)):
+    jobs = get_job_helper()
+    # Latency budget shared by all stages: X-Request-Deadline header (seconds) or REQUEST_DEADLINE_SECONDS
+    deadline = Deadline.from_header(x_request_deadline)
+    # Retries with the same nonce attach to the job already running (or recently finished)
+    job_id = jobs.submit(
+        _request_info(request),
+        lambda jid: _run_job(request, jid, deadline),
+        payload=_request_payload(request),
+        dedup_key=_dedup_key(request)
+    )
+    if request.async_mode:
         return JSONResponse(
             status_code=status.HTTP_200_OK,
             content={
                 "success": True,
-                "message": "Application generated and deployed (fallback)",
-                "deployment": {
-                    "repo_name": repo_data.get("repo_name"),
-                    "repo_url": repo_data.get("repo_url"),
-                    "commit_sha": repo_data.get("commit_sha"),
-                    "pages_url": repo_data.get("pages_url")
-                },
-                "evaluation_notification": {"sent": False},
-                "metadata": {"round": 1, "nonce": "fallback", "timestamp": datetime.utcnow().isoformat()},
-                "errors": [str(e)],
-                "fallback": True
+                "message": "Request accepted for background processing",
+                "job_id": job_id,
+                "status_url": f"/api/jobs/{job_id}",
+                "metadata": {
+                    "round": request.round,
+                    "nonce": request.nonce,
+                    "timestamp": datetime.utcnow().isoformat()
+                }
             }
         )
+    try:
+        response_data = await jobs.wait(job_id)
+        return JSONResponse(status_code=status.HTTP_200_OK, content=response_data)
+    except Exception as e:
+        # Last-resort response to comply with "always 200"
+        logger.error(f"Unexpected error processing request (responding 200 per policy): {e}")
+        return JSONResponse(status_code=status.HTTP_200_OK, content=_fallback_response(e))
+
+
+def _format_stream_event(event: Dict[str, Any], stream_format: str) -> str:
+    if stream_format == "ndjson":
+        return json.dumps(event) + "\n"
+    return f"event: {event.get('event', 'message')}\ndata: {json.dumps(event)}\n\n"
+
+
+@app.post("/api/request/stream")
+async def process_request_stream(
+    request: TaskRequest,
+    format: Optional[str] = None,
+    accept: Optional[str] = Header(default=None),
+    x_request_deadline: Optional[str] = Header(default=None)
+):
+    """
+    Same pipeline as /api/request, streamed as Server-Sent Events (default) or
+    NDJSON (?format=ndjson or Accept: application/x-ndjson). Emits one event per
+    stage update; the final "result" event carries the usual response body.
+    """
+    stream_format = (format or "").lower()
+    if stream_format not in ("sse", "ndjson"):
+        stream_format = "ndjson" if accept and "application/x-ndjson" in accept else "sse"
+    heartbeat = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+    jobs = get_job_helper()
+    deadline = Deadline.from_header(x_request_deadline)
+    job_id = jobs.submit(
+        _request_info(request),
+        lambda jid: _run_job(request, jid, deadline),
+        payload=_request_payload(request),
+        dedup_key=_dedup_key(request)
+    )
+    queue = await jobs.subscribe(job_id)
+
+    async def _events():
+        try:
+            yield _format_stream_event({"event": "accepted", "job_id": job_id}, stream_format)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Keep proxies and clients from timing out while a stage is still running
+                    if stream_format == "sse":
+                        yield ": keep-alive\n\n"
+                    else:
+                        yield _format_stream_event({"event": "heartbeat"}, stream_format)
+                    continue
+                if event["event"] == "error":
+                    # Honour the "always 200 with a body" policy even for failed jobs
+                    event = {"event": "result", "result": _fallback_response(RuntimeError(event.get("error")))}
+                yield _format_stream_event(event, stream_format)
+                if event["event"] == "result":
+                    break
+        finally:
+            jobs.unsubscribe(job_id, queue)
+
+    media_type = "application/x-ndjson" if stream_format == "ndjson" else "text/event-stream"
+    return StreamingResponse(_events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+
+@app.post("/api/requests:batch")
+async def process_batch(batch: BatchTaskRequest, x_request_deadline: Optional[str] = Header(default=None)):
+    """
+    Run many TaskRequests with a shared concurrency limit. Items go through the
+    same job pipeline (and nonce deduplication) as /api/request; async_mode on
+    individual items is ignored.
+    """
+    max_items = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    if len(batch.requests) > max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch has {len(batch.requests)} items; the limit is {max_items}"
+        )
+    concurrency = batch.concurrency or int(os.getenv("BATCH_CONCURRENCY", "8"))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    jobs = get_job_helper()
+
+    async def _run_item(index: int, request: TaskRequest) -> Dict[str, Any]:
+        async with semaphore:
+            deadline = Deadline.from_header(x_request_deadline)
+            job_id = jobs.submit(
+                _request_info(request),
+                lambda jid: _run_job(request, jid, deadline),
+                payload=_request_payload(request),
+                dedup_key=_dedup_key(request)
+            )
+            try:
+                result = await jobs.wait(job_id)
+            except Exception as e:
+                logger.error(f"Batch item {index} failed (responding with fallback): {e}")
+                result = _fallback_response(e)
+            return {"index": index, "job_id": job_id, "nonce": request.nonce, "result": result}
+
+    tasks = [asyncio.ensure_future(_run_item(i, r)) for i, r in enumerate(batch.requests)]
+
+    if batch.stream:
+        async def _results():
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    yield json.dumps(await finished) + "\n"
+                yield json.dumps({"event": "done", "count": len(tasks)}) + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(_results(), media_type="application/x-ndjson")
+
+    results = await asyncio.gather(*tasks)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "success": True,
+            "count": len(results),
+            "results": results,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    )
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = await get_job_helper().aget_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    return JSONResponse(status_code=status.HTTP_200_OK, content=job)
+
+
+@app.post("/api/jobs/status")
+async def get_jobs_status(request: JobStatusRequest):
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"jobs": await get_job_helper().aget_jobs(request.job_ids)}
+    )
 
 
 @app.post("/api/evaluate")
@@ -339,6 +982,55 @@ async def receive_evaluation(request: EvaluationRequest):
         )
 
 
+@app.on_event("startup")
+async def resume_unfinished_jobs():
+    """Resume jobs interrupted by a restart from their last finished stage"""
+    jobs = get_job_helper()
+    for stored in await asyncio.get_running_loop().run_in_executor(None, jobs.get_unfinished_jobs):
+        try:
+            payload = dict(stored["request"])
+            payload.setdefault("secret", "")
+            request = TaskRequest(**payload)
+        except Exception as e:
+            logger.error(f"Cannot resume job {stored['job_id']}: {e}")
+            jobs.fail_job(stored["job_id"], f"Unrecoverable request: {e}")
+            continue
+        logger.info(f"Resuming interrupted job {stored['job_id']}")
+        jobs.submit(
+            _request_info(request),
+            lambda jid, request=request: _run_job(request, jid, Deadline.from_header(None), resume=True),
+            payload=_request_payload(request),
+            job_id=stored["job_id"],
+            dedup_key=_dedup_key(request)
+        )
+
+
+@app.on_event("startup")
+async def start_repo_pool():
+    """Create the GitHub helper at startup when a repository pool is configured, so the pool fills early"""
+    if int(os.getenv("REPO_POOL_SIZE", "0")) <= 0:
+        return
+    try:
+        get_github_helper()
+    except Exception as e:
+        logger.error(f"Repository pool not started: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_helpers():
+    global executor_helper
+    if executor_helper is not None:
+        executor_helper.shutdown(wait=False)
+        executor_helper = None
+    if github_helper is not None:
+        github_helper.shutdown()
+    if llm_helper is not None:
+        await llm_helper.aclose()
+    if job_helper is not None and job_helper.store is not None:
+        # Let the job store's writer thread commit what is still queued
+        await asyncio.get_running_loop().run_in_executor(None, job_helper.store.flush, 5)
+
+
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
     return JSONResponse(status_code=404, content={"detail": "Endpoint not found"})
@@ -0,0 +1,66 @@
+"""
+Artifact Helper Module for keeping each round's generated files per task
+Revision rounds start from the previous round's files instead of regenerating the app from scratch.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (email, task)
+ArtifactKey = Tuple[str, str]
+
+
+class ArtifactStore:
+    def __init__(self, store=None):
+        """
+        Files are kept in memory for the last ARTIFACT_MAX_TASKS tasks and, when
+        a store (DBHelper) is given, persisted there so revisions work across
+        restarts.
+        """
+        self.store = store
+        self.max_tasks = max(1, int(os.getenv("ARTIFACT_MAX_TASKS", "1000")))
+        # (email, task) -> {round: files}
+        self._memory: "OrderedDict[ArtifactKey, Dict[int, Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(email: str, task: str) -> ArtifactKey:
+        return ((email or "").strip().lower(), task or "")
+
+    def save(self, email: str, task: str, round_number: int, files: Dict[str, str]):
+        key = self._key(email, task)
+        with self._lock:
+            rounds = self._memory.pop(key, {})
+            rounds[round_number] = dict(files)
+            self._memory[key] = rounds
+            while len(self._memory) > self.max_tasks:
+                self._memory.popitem(last=False)
+        if self.store is not None:
+            try:
+                self.store.defer(lambda: self.store.save_artifacts(key[0], key[1], round_number, files))
+            except Exception as e:
+                logger.error(f"Artifact store write failed: {e}")
+
+    def get_previous(self, email: str, task: str, round_number: int) -> Optional[Dict[str, Any]]:
+        """Files of the latest stored round before `round_number`, as {"round": n, "files": {...}}"""
+        key = self._key(email, task)
+        with self._lock:
+            rounds = self._memory.get(key) or {}
+            earlier = [r for r in rounds if r < round_number]
+            if earlier:
+                latest = max(earlier)
+                return {"round": latest, "files": dict(rounds[latest])}
+        if self.store is None:
+            return None
+        try:
+            return self.store.get_latest_artifacts(key[0], key[1], round_number)
+        except Exception as e:
+            logger.error(f"Failed to load artifacts for {key[1]}: {e}")
+            return None
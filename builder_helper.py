@@ -0,0 +1,197 @@
+"""
+Builder Helper Module for routing briefs to deterministic app builders
+All builder trigger phrases are compiled into one Aho-Corasick automaton; a brief is scored in a single pass.
+"""
+
+import os
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PatternMatcher:
+    """
+    Aho-Corasick automaton over lowercase trigger phrases. Matches must sit on
+    word boundaries (neighbours are not letters or digits), so "sales" matches
+    "sum-of-sales" but not "wholesalesman".
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        for index, pattern in enumerate(patterns):
+            self._add(pattern, index)
+        self._link()
+
+    def _add(self, pattern: str, index: int):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append(index)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, int]]:
+        """(pattern index, end offset) for every boundary-respecting match in `text`"""
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for index in self._output[state]:
+                start = i - len(self.patterns[index]) + 1
+                before = text[start - 1] if start > 0 else " "
+                after = text[i + 1] if i + 1 < len(text) else " "
+                if not before.isalnum() and not after.isalnum():
+                    matches.append((index, i + 1))
+        return matches
+
+
+class _Builder:
+    def __init__(self, name: str, build: Callable[..., Any], triggers: Dict[str, float], min_score: float):
+        self.name = name
+        self.build = build
+        self.triggers = triggers
+        self.min_score = min_score
+        self.selected = 0
+        self.near_misses = 0
+        self.failures = 0
+
+
+class BuilderRegistry:
+    def __init__(self, min_score: Optional[float] = None):
+        """
+        A builder is chosen when the summed weight of its distinct triggers found
+        in the text reaches its min_score (BUILDER_MIN_SCORE by default); the
+        highest-scoring builder wins, earlier registrations break ties.
+        """
+        self.min_score = min_score if min_score is not None else float(os.getenv("BUILDER_MIN_SCORE", "5"))
+        self._builders: List[_Builder] = []
+        self._matcher: Optional[PatternMatcher] = None
+        # pattern index -> [(builder index, weight)]
+        self._pattern_owners: List[List[Tuple[int, float]]] = []
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.misses = 0
+
+    def register(
+        self,
+        name: str,
+        build: Callable[..., Any],
+        triggers: Dict[str, float],
+        min_score: Optional[float] = None
+    ):
+        """Add a builder with {trigger phrase: weight}; the matcher is recompiled on next use"""
+        with self._lock:
+            self._builders.append(_Builder(
+                name,
+                build,
+                {phrase.lower(): weight for phrase, weight in triggers.items()},
+                self.min_score if min_score is None else min_score,
+            ))
+            self._matcher = None
+
+    def _compile(self) -> PatternMatcher:
+        patterns: List[str] = []
+        owners: List[List[Tuple[int, float]]] = []
+        index_of: Dict[str, int] = {}
+        for b_index, builder in enumerate(self._builders):
+            for phrase, weight in builder.triggers.items():
+                if phrase not in index_of:
+                    index_of[phrase] = len(patterns)
+                    patterns.append(phrase)
+                    owners.append([])
+                owners[index_of[phrase]].append((b_index, weight))
+        self._pattern_owners = owners
+        self._matcher = PatternMatcher(patterns)
+        return self._matcher
+
+    def score(self, text: str) -> Dict[str, float]:
+        """Score of every builder with at least one trigger in `text`"""
+        with self._lock:
+            matcher = self._matcher or self._compile()
+            owners = self._pattern_owners
+            builders = self._builders
+        seen = {index for index, _ in matcher.find((text or "").lower())}
+        scores: Dict[str, float] = {}
+        for index in seen:
+            for b_index, weight in owners[index]:
+                name = builders[b_index].name
+                scores[name] = scores.get(name, 0.0) + weight
+        return scores
+
+    def match(self, text: str) -> Optional[Tuple[str, Callable[..., Any], float]]:
+        """(name, build, score) of the best builder above its threshold, else None"""
+        scores = self.score(text)
+        best = None
+        with self._lock:
+            self.lookups += 1
+            for builder in self._builders:
+                score = scores.get(builder.name)
+                if score is None:
+                    continue
+                if score < builder.min_score:
+                    builder.near_misses += 1
+                    continue
+                if best is None or score > best[2]:
+                    best = (builder.name, builder.build, score)
+            if best is None:
+                self.misses += 1
+            else:
+                self._get(best[0]).selected += 1
+        return best
+
+    def _get(self, name: str) -> Optional[_Builder]:
+        for builder in self._builders:
+            if builder.name == name:
+                return builder
+        return None
+
+    def record_failure(self, name: str):
+        with self._lock:
+            builder = self._get(name)
+            if builder is not None:
+                builder.failures += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "misses": self.misses,
+                "hit_rate": round((self.lookups - self.misses) / self.lookups, 4) if self.lookups else 0.0,
+                "min_score": self.min_score,
+                "builders": {
+                    b.name: {
+                        "selected": b.selected,
+                        "near_misses": b.near_misses,
+                        "failures": b.failures,
+                        "hit_rate": round(b.selected / self.lookups, 4) if self.lookups else 0.0,
+                    }
+                    for b in self._builders
+                },
+            }
@@ -0,0 +1,131 @@
+"""
+Cache Helper Module for content-addressed LLM response caching
+Bounded in-memory LRU tier in front of a persistent on-disk tier, both with TTLs.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(self):
+        """
+        Configured by LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS
+        (memory tier), LLM_CACHE_DIR and LLM_CACHE_DISK_TTL_SECONDS (disk tier;
+        an empty LLM_CACHE_DIR disables it).
+        """
+        self.enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+        self.max_entries = max(1, int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")))
+        self.ttl = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+        self.disk_dir = os.getenv("LLM_CACHE_DIR", ".cache/llm")
+        self.disk_ttl = float(os.getenv("LLM_CACHE_DISK_TTL_SECONDS", "604800"))
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, prompt: str, temperature: float) -> str:
+        """Content address of one completion request"""
+        raw = json.dumps([model, system_prompt, prompt, temperature], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+        value = self._disk_get(key, now)
+        if value is not None:
+            self._count("disk_hits")
+            self._memory_put(key, value, now)
+            return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        self._memory_put(key, value, now)
+        self._disk_put(key, value, now)
+        self._count("writes")
+
+    def _memory_put(self, key: str, value: str, created: float):
+        with self._lock:
+            self._memory[key] = (created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _disk_get(self, key: str, now: float) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Unreadable cache entry {path}: {e}")
+            return None
+        if now - float(entry.get("created", 0)) > self.disk_ttl:
+            self._count("expired")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get("value")
+
+    def _disk_put(self, key: str, value: str, created: float):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"created": created, "value": value}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Failed to write cache entry {path}: {e}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                **self.stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,302 @@
+"""
+DB Helper Module for persisting jobs, their stage results, generated artifacts and task repositories in SQLite
+Uses the DATABASE_URL from the environment (sqlite:///path) in WAL mode. Writes are queued to
+a background writer thread and committed in batches, so callers on the event loop never wait on disk.
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, Optional, List
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_URL = "sqlite:///./llm_deployment.db"
+
+# Most writes committed in one transaction by the writer thread
+WRITE_BATCH_SIZE = 256
+
+# Longest a read waits for queued writes before querying anyway
+READ_FLUSH_TIMEOUT_SECONDS = 2.0
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        request_json TEXT NOT NULL,
+        result_json TEXT,
+        error TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)",
+    """
+    CREATE TABLE IF NOT EXISTS job_stages (
+        job_id TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        data_json TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (job_id, stage)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS artifacts (
+        email TEXT NOT NULL,
+        task TEXT NOT NULL,
+        round INTEGER NOT NULL,
+        files_json TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (email, task, round)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS repo_index (
+        email TEXT NOT NULL,
+        task TEXT NOT NULL,
+        repo_name TEXT NOT NULL,
+        commit_sha TEXT,
+        tree_sha TEXT,
+        files_json TEXT,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (email, task)
+    )
+    """,
+]
+
+
+def _sqlite_path(database_url: str) -> str:
+    """Turn sqlite:///./file.db / sqlite:////abs/file.db into a filesystem path"""
+    prefix = "sqlite:///"
+    if not database_url.startswith(prefix):
+        raise ValueError(f"Only sqlite:/// DATABASE_URL values are supported, got: {database_url}")
+    return database_url[len(prefix):] or ":memory:"
+
+
+class DBHelper:
+    def __init__(self, database_url: Optional[str] = None):
+        self.database_url = database_url or os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
+        self.path = _sqlite_path(self.database_url)
+        if self.path != ":memory:":
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+
+        # One shared connection guarded by a lock (re-entrant so a batch can hold it across
+        # its writes); WAL keeps readers off the writer's back
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("PRAGMA busy_timeout=5000")
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+        logger.info(f"Using SQLite job store at {self.path}")
+
+        self._writes: "queue.Queue[Callable[[], Any]]" = queue.Queue()
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        # [interval seconds, fn, next run (monotonic)] run by the writer thread between batches
+        self._periodic: List[list] = []
+        self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+        self._writer.start()
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _read(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """Query after the queued writes have landed (waiting a bounded time), so callers read their own writes"""
+        if not self.flush(timeout=READ_FLUSH_TIMEOUT_SECONDS):
+            logger.warning("Job store writes still queued; reading without them")
+        return self._execute(sql, params)
+
+    # ------------------------ Background writes ------------------------
+    def defer(self, write: Callable[[], Any]):
+        """Queue `write` (a call to one of the save/update methods) for the writer thread"""
+        with self._pending_cond:
+            self._pending += 1
+        self._writes.put(write)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued write has been committed; False on timeout"""
+        if threading.current_thread() is self._writer:
+            return True
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def add_periodic(self, interval: float, fn: Callable[[], Any]):
+        """Run `fn` on the writer thread now and then every `interval` seconds"""
+        self._periodic.append([interval, fn, time.monotonic()])
+        self._writes.put(None)
+
+    def _write_loop(self):
+        while True:
+            now = time.monotonic()
+            for task in list(self._periodic):
+                if task[2] <= now:
+                    task[2] = now + task[0]
+                    try:
+                        task[1]()
+                    except Exception as e:
+                        logger.error(f"Periodic job store task failed: {e}")
+            due = [task[2] - now for task in self._periodic]
+            try:
+                first = self._writes.get(timeout=max(0.0, min(due)) if due else None)
+            except queue.Empty:
+                continue
+            batch = [first] if first is not None else []
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    write = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if write is not None:
+                    batch.append(write)
+            if batch:
+                self._commit_batch(batch)
+
+    def _commit_batch(self, batch: List[Callable[[], Any]]):
+        """Run the writes in one transaction; if that fails, one by one so a bad write only loses itself"""
+        try:
+            with self._lock:
+                self.conn.execute("BEGIN")
+                try:
+                    for write in batch:
+                        write()
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+                self.conn.execute("COMMIT")
+        except Exception:
+            for write in batch:
+                try:
+                    write()
+                except Exception as e:
+                    logger.error(f"Job store write failed: {e}")
+        finally:
+            with self._pending_cond:
+                self._pending -= len(batch)
+                self._pending_cond.notify_all()
+
+    # ------------------------ Jobs ------------------------
+    def save_job(self, job_id: str, request_data: Dict[str, Any], status: str):
+        now = datetime.utcnow().isoformat()
+        self._execute(
+            "INSERT OR IGNORE INTO jobs (job_id, status, request_json, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, status, json.dumps(request_data), now, now),
+        )
+
+    def update_job(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        self._execute(
+            "UPDATE jobs SET status = ?, result_json = COALESCE(?, result_json), error = COALESCE(?, error), updated_at = ? WHERE job_id = ?",
+            (status, json.dumps(result) if result is not None else None, error, datetime.utcnow().isoformat(), job_id),
+        )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._read("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+        if not rows:
+            return None
+        row = rows[0]
+        return {
+            "job_id": row["job_id"],
+            "status": row["status"],
+            "request": json.loads(row["request_json"]),
+            "result": json.loads(row["result_json"]) if row["result_json"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def get_unfinished_jobs(self, statuses: List[str]) -> List[Dict[str, Any]]:
+        """Jobs whose status is one of `statuses`, oldest first"""
+        placeholders = ",".join("?" for _ in statuses)
+        rows = self._read(
+            f"SELECT job_id, request_json FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at",
+            tuple(statuses),
+        )
+        return [{"job_id": row["job_id"], "request": json.loads(row["request_json"])} for row in rows]
+
+    def prune_jobs(self, statuses: List[str], max_age_seconds: float) -> int:
+        """Delete jobs in `statuses` (and their stage results) last updated over `max_age_seconds` ago"""
+        cutoff = (datetime.utcnow() - timedelta(seconds=max_age_seconds)).isoformat()
+        placeholders = ",".join("?" for _ in statuses)
+        where = f"status IN ({placeholders}) AND updated_at < ?"
+        with self._lock:
+            self.conn.execute(
+                f"DELETE FROM job_stages WHERE job_id IN (SELECT job_id FROM jobs WHERE {where})",
+                (*statuses, cutoff),
+            )
+            deleted = self.conn.execute(f"DELETE FROM jobs WHERE {where}", (*statuses, cutoff)).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} finished jobs older than {max_age_seconds / 3600:g}h")
+        return deleted
+
+    # ------------------------ Stage results ------------------------
+    def save_stage_result(self, job_id: str, stage: str, data: Dict[str, Any]):
+        self._execute(
+            "INSERT OR REPLACE INTO job_stages (job_id, stage, data_json, updated_at) VALUES (?, ?, ?, ?)",
+            (job_id, stage, json.dumps(data), datetime.utcnow().isoformat()),
+        )
+
+    def get_stage_results(self, job_id: str) -> Dict[str, Dict[str, Any]]:
+        rows = self._read("SELECT stage, data_json FROM job_stages WHERE job_id = ?", (job_id,))
+        return {row["stage"]: json.loads(row["data_json"]) for row in rows}
+
+    # ------------------------ Artifacts ------------------------
+    def save_artifacts(self, email: str, task: str, round_number: int, files: Dict[str, str]):
+        self._execute(
+            "INSERT OR REPLACE INTO artifacts (email, task, round, files_json, created_at) VALUES (?, ?, ?, ?, ?)",
+            (email, task, round_number, json.dumps(files), datetime.utcnow().isoformat()),
+        )
+
+    def get_latest_artifacts(self, email: str, task: str, before_round: int) -> Optional[Dict[str, Any]]:
+        """Files of the latest round before `before_round`, as {"round": n, "files": {...}}"""
+        rows = self._read(
+            "SELECT round, files_json FROM artifacts WHERE email = ? AND task = ? AND round < ? ORDER BY round DESC LIMIT 1",
+            (email, task, before_round),
+        )
+        if not rows:
+            return None
+        return {"round": rows[0]["round"], "files": json.loads(rows[0]["files_json"])}
+
+    # ------------------------ Task repositories ------------------------
+    def save_repo_index(self, email: str, task: str, entry: Dict[str, Any]):
+        self._execute(
+            "INSERT OR REPLACE INTO repo_index (email, task, repo_name, commit_sha, tree_sha, files_json, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                email, task, entry["repo_name"], entry.get("commit_sha"), entry.get("tree_sha"),
+                json.dumps(entry.get("files") or {}), datetime.utcnow().isoformat(),
+            ),
+        )
+
+    def get_repo_index(self, email: str, task: str) -> Optional[Dict[str, Any]]:
+        """Repository last deployed for (email, task) as {"repo_name", "commit_sha", "tree_sha", "files"}"""
+        rows = self._read(
+            "SELECT repo_name, commit_sha, tree_sha, files_json FROM repo_index WHERE email = ? AND task = ?",
+            (email, task),
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        return {
+            "repo_name": row["repo_name"],
+            "commit_sha": row["commit_sha"],
+            "tree_sha": row["tree_sha"],
+            "files": json.loads(row["files_json"] or "{}"),
+        }
+
+    def close(self):
+        self.flush(timeout=10)
+        with self._lock:
+            self.conn.close()
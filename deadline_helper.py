@@ -0,0 +1,84 @@
+"""
+Deadline Helper Module for sharing one latency budget across pipeline stages
+Each stage gets what is left of the budget minus reserves for the stages after it.
+"""
+
+import os
+import time
+import logging
+from typing import Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pipeline stages in execution order
+STAGES = ("generation", "deployment", "evaluation")
+
+# Fraction of the total budget held back for each stage while earlier stages run;
+# override with DEADLINE_<STAGE>_RESERVE
+DEFAULT_RESERVES = {
+    "generation": 0.0,
+    "deployment": 0.25,
+    "evaluation": 0.1,
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage has no budget left to run"""
+
+
+class Deadline:
+    def __init__(self, budget_seconds: Optional[float] = None):
+        """
+        A budget of None or <= 0 means no deadline: every stage timeout is None.
+        """
+        self.budget = budget_seconds if budget_seconds and budget_seconds > 0 else None
+        self.started = time.monotonic()
+        self.reserves: Dict[str, float] = {
+            stage: float(os.getenv(f"DEADLINE_{stage.upper()}_RESERVE", str(default)))
+            for stage, default in DEFAULT_RESERVES.items()
+        }
+
+    @classmethod
+    def from_header(cls, header_value: Optional[str]) -> "Deadline":
+        """Build a deadline from an X-Request-Deadline header, else REQUEST_DEADLINE_SECONDS"""
+        budget = None
+        if header_value:
+            try:
+                budget = float(header_value)
+            except ValueError:
+                logger.warning(f"Ignoring invalid deadline header: {header_value!r}")
+        if budget is None:
+            budget = float(os.getenv("REQUEST_DEADLINE_SECONDS", "0") or 0)
+        return cls(budget)
+
+    def remaining(self) -> Optional[float]:
+        if self.budget is None:
+            return None
+        return self.budget - (time.monotonic() - self.started)
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def stage_timeout(self, stage: str) -> Optional[float]:
+        """
+        Seconds `stage` may use: the remaining budget minus the reserves of all
+        later stages. Raises DeadlineExceeded when nothing is left.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        later = STAGES[STAGES.index(stage) + 1:] if stage in STAGES else ()
+        timeout = remaining - sum(self.reserves.get(s, 0.0) * self.budget for s in later)
+        if timeout <= 0:
+            raise DeadlineExceeded(f"No budget left for {stage} ({remaining:.1f}s of {self.budget:.1f}s remaining)")
+        return timeout
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        remaining = self.remaining()
+        return {
+            "budget_seconds": self.budget,
+            "remaining_seconds": round(remaining, 3) if remaining is not None else None,
+        }
@@ -24,9 +24,11 @@ class DeployHelper:
                                   round_num: int,
                                   nonce: str,
                                   repo_data: Dict[str, Any],
-                                  app_metadata: Dict[str, Any]) -> Dict[str, Any]:
+                                  app_metadata: Dict[str, Any],
+                                  timeout: Optional[float] = None) -> Dict[str, Any]:
         """
-        Send deployment metadata to the evaluation API
+        Send deployment metadata to the evaluation API.
+        `timeout` can only shorten the default HTTP timeout, never extend it.
         """
         try:
             # Prepare the payload
@@ -50,7 +52,8 @@ class DeployHelper:
             logger.info(f"Payload: {json.dumps(payload, indent=2)}")
             
             # Send the request
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            effective_timeout = min(self.timeout, timeout) if timeout is not None else self.timeout
+            async with httpx.AsyncClient(timeout=effective_timeout) as client:
                 response = await client.post(
                     evaluation_url,
                     json=payload,
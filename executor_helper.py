@@ -0,0 +1,172 @@
+"""
+Executor Helper Module for running blocking pipeline stages off the event loop
+Each stage (LLM generation, GitHub deployment, ...) gets its own bounded thread pool.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Default pool sizes per stage; override with EXECUTOR_<STAGE>_WORKERS
+DEFAULT_STAGE_WORKERS = {
+    "llm": 16,
+    "github": 8,
+    "default": 4,
+}
+
+# Weight of the newest sample in the moving average of queue wait time
+WAIT_EWMA_ALPHA = 0.2
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when a stage already has its maximum number of queued calls"""
+
+
+class _StagePool:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"stage-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_wait = 0.0
+        # ticket -> submit time of each call still waiting for a worker
+        self._waiting: Dict[int, float] = {}
+        self._tickets = itertools.count()
+
+    def enqueue(self) -> int:
+        with self._lock:
+            if self.max_queue > 0 and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturatedError(
+                    f"Stage '{self.name}' queue is full ({self.queued}/{self.max_queue})"
+                )
+            self.queued += 1
+            ticket = next(self._tickets)
+            self._waiting[ticket] = time.monotonic()
+            return ticket
+
+    def dequeue_cancelled(self, ticket: int):
+        with self._lock:
+            self.queued -= 1
+            self._waiting.pop(ticket, None)
+
+    def start(self, ticket: int, waited: float):
+        with self._lock:
+            self.queued -= 1
+            self._waiting.pop(ticket, None)
+            self.running += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.recent_wait = WAIT_EWMA_ALPHA * waited + (1 - WAIT_EWMA_ALPHA) * self.recent_wait
+
+    def finish(self, ok: bool):
+        with self._lock:
+            self.running -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def oldest_wait(self) -> float:
+        """Seconds the longest-waiting queued call has waited so far (0 when nothing is queued)"""
+        with self._lock:
+            return time.monotonic() - min(self._waiting.values()) if self._waiting else 0.0
+
+    def metrics(self) -> Dict[str, Any]:
+        oldest_wait = self.oldest_wait()
+        with self._lock:
+            started = self.completed + self.failed + self.running
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(1000 * self.total_wait / started, 2) if started else 0.0,
+                "recent_wait_ms": round(1000 * self.recent_wait, 2),
+                "oldest_wait_ms": round(1000 * oldest_wait, 2),
+                "max_wait_ms": round(1000 * self.max_wait, 2),
+            }
+
+
+class ExecutorHelper:
+    def __init__(self):
+        """
+        Stage pools are created lazily; sizes come from EXECUTOR_<STAGE>_WORKERS
+        and EXECUTOR_<STAGE>_MAX_QUEUE (falling back to EXECUTOR_MAX_QUEUE).
+        """
+        self.default_max_queue = int(os.getenv("EXECUTOR_MAX_QUEUE", "256"))
+        self._pools: Dict[str, _StagePool] = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self, stage: str) -> _StagePool:
+        pool = self._pools.get(stage)
+        if pool is not None:
+            return pool
+        with self._lock:
+            pool = self._pools.get(stage)
+            if pool is None:
+                prefix = f"EXECUTOR_{stage.upper()}"
+                default_workers = DEFAULT_STAGE_WORKERS.get(stage, DEFAULT_STAGE_WORKERS["default"])
+                workers = max(1, int(os.getenv(f"{prefix}_WORKERS", str(default_workers))))
+                max_queue = int(os.getenv(f"{prefix}_MAX_QUEUE", str(self.default_max_queue)))
+                pool = _StagePool(stage, workers, max_queue)
+                self._pools[stage] = pool
+                logger.info(f"Created executor pool '{stage}' (workers={workers}, max_queue={max_queue})")
+            return pool
+
+    async def run(self, stage: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking callable on the pool for `stage` and await its result.
+        Raises ExecutorSaturatedError when the stage queue is full.
+        """
+        pool = self._get_pool(stage)
+        ticket = pool.enqueue()
+        submitted = time.monotonic()
+
+        def _call():
+            pool.start(ticket, time.monotonic() - submitted)
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                pool.finish(False)
+                raise
+            pool.finish(True)
+            return result
+
+        try:
+            future = pool.executor.submit(_call)
+        except Exception:
+            pool.dequeue_cancelled(ticket)
+            raise
+        future.add_done_callback(lambda f: pool.dequeue_cancelled(ticket) if f.cancelled() else None)
+        return await asyncio.wrap_future(future)
+
+    def get_stage_metrics(self, stage: str) -> Dict[str, Any]:
+        return self._get_pool(stage).metrics()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {name: pool.metrics() for name, pool in list(self._pools.items())}
+
+    def shutdown(self, wait: bool = False):
+        for pool in list(self._pools.values()):
+            pool.executor.shutdown(wait=wait, cancel_futures=True)
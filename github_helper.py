@@ -4,16 +4,35 @@ Updated for classic personal access token usage.
 """
 
 import os
+import random
+import hashlib
 import logging
-from typing import Dict, Any, Optional
-from github import Github, GithubException
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Optional, Callable, Tuple
+from github import Github, GithubException, InputGitTreeElement
 from datetime import datetime
 import time
 
+from repo_pool_helper import RepoPool
+from resilience_helper import RETRYABLE_STATUS
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class BranchMovedError(RuntimeError):
+    """The branch head moved while a commit was built (non-fast-forward ref update); rebuilding fixes it"""
+
+
+def git_blob_sha(content: str) -> str:
+    """SHA-1 git assigns to `content` as a blob, so unchanged files can be detected without uploading them"""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
 class GitHubHelper:
     def __init__(self):
         self.token = os.getenv("GITHUB_TOKEN")
@@ -32,6 +51,40 @@ class GitHubHelper:
             logger.error(f"Failed to resolve GitHub owner: status={getattr(e, 'status', None)} data={getattr(e, 'data', None)}")
             raise
 
+        # repo full name -> (head commit sha, tree sha, {path: blob sha}) as of our last read or commit
+        self.tree_cache_size = max(0, int(os.getenv("GITHUB_TREE_CACHE_SIZE", "256")))
+        self._tree_cache: "OrderedDict[str, Tuple[str, str, Dict[str, str]]]" = OrderedDict()
+        self._tree_lock = threading.Lock()
+        self.stats = {
+            "commits": 0,
+            "commits_skipped": 0,
+            "blobs_uploaded": 0,
+            "blobs_unchanged": 0,
+            "tree_cache_hits": 0,
+            "tree_fetches": 0,
+            "retries": 0,
+        }
+
+        # Blob uploads run on a shared pool; each worker thread keeps its own client (and HTTP session)
+        self.upload_workers = max(1, int(os.getenv("GITHUB_UPLOAD_WORKERS", "8")))
+        self._upload_pool = ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="github-blob")
+        self._local = threading.local()
+        # Concurrent content-creating requests per repository, kept low for GitHub's secondary rate limits
+        self.repo_concurrency = max(1, int(os.getenv("GITHUB_REPO_CONCURRENCY", "4")))
+        self._repo_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._repo_slots_lock = threading.Lock()
+        self.retry_attempts = max(1, int(os.getenv("GITHUB_RETRY_ATTEMPTS", "5")))
+        self.retry_base_delay = float(os.getenv("GITHUB_RETRY_BASE_DELAY", "0.5"))
+        self.retry_max_delay = float(os.getenv("GITHUB_RETRY_MAX_DELAY", "30"))
+
+        # Pre-created repositories, so new apps skip repo creation on the request path
+        self.repo_pool = RepoPool(
+            self.owner,
+            create_repo=lambda name, description: self._create_repository(name, {"description": description}),
+            delete_repo=self.delete_repository,
+        )
+        self.repo_pool.start()
+
     def create_repo_and_deploy(
         self, 
         app_name: str, 
@@ -40,35 +93,55 @@ class GitHubHelper:
         js_content: str,
         metadata: Dict[str, Any],
         is_revision: bool = False,
-        existing_repo_name: Optional[str] = None
+        existing_repo_name: Optional[str] = None,
+        repo=None,
+        on_progress: Optional[Callable[..., None]] = None,
+        known_tree: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
-        Create a new repository or update existing one and enable GitHub Pages
+        Create a new repository or update existing one and enable GitHub Pages.
+        A repository already created by prepare_repository can be passed as `repo`.
+        For revisions, known_tree ({"commit_sha", "tree_sha", "files"}) from the
+        last deploy to existing_repo_name saves fetching its tree listing; a new
+        repository is created if existing_repo_name no longer exists.
+        on_progress(stage, status, **detail) is called as the repo is created and
+        as each file is committed (from the calling thread).
         """
         try:
-            if is_revision and existing_repo_name:
-                repo_name = existing_repo_name
-                repo = self.github.get_repo(f"{self.owner.login}/{repo_name}")
-                logger.info(f"Updating existing repository: {repo_name}")
-            else:
+            if repo is not None:
+                logger.info(f"Deploying to prepared repository: {repo.name}")
+            elif is_revision and existing_repo_name:
+                repo = self._existing_repository(existing_repo_name)
+                if repo is not None:
+                    logger.info(f"Updating existing repository: {repo.name}")
+                    self._report(on_progress, "repository", "completed", repo_name=repo.name, existing=True)
+                    if known_tree and known_tree.get("commit_sha"):
+                        self._cache_tree(
+                            repo.full_name, known_tree["commit_sha"], known_tree.get("tree_sha"), known_tree.get("files") or {}
+                        )
+            if repo is None:
                 repo_name = self._generate_repo_name(app_name)
-                repo = self._create_repository(repo_name, metadata)
-                logger.info(f"Created new repository: {repo_name}")
+                repo = self._new_repository(repo_name, metadata)
+                logger.info(f"Created new repository: {repo.name}")
+                self._report(on_progress, "repository", "completed", repo_name=repo.name)
 
             # Prepare files for deployment
             extra_files = metadata.get("_extra_files") if isinstance(metadata, dict) else None
             files_to_commit = self._prepare_files(html_content, css_content, js_content, metadata, extra_files)
 
             # Commit files
-            commit_sha = self._commit_files(repo, files_to_commit, is_revision)
+            commit_sha = self._commit_files(repo, files_to_commit, is_revision, on_progress=on_progress)
 
             # Enable GitHub Pages
             pages_url = self._enable_github_pages(repo)
+            tree = self._cached_tree(repo.full_name)
 
             return {
                 "repo_name": repo.name,
                 "repo_url": repo.html_url,
                 "commit_sha": commit_sha,
+                "tree_sha": tree[1] if tree and tree[0] == commit_sha else None,
+                "tree_files": tree[2] if tree and tree[0] == commit_sha else None,
                 "pages_url": pages_url,
                 "success": True
             }
@@ -86,12 +159,59 @@ class GitHubHelper:
                 "error": repr(e)
             }
 
+    def prepare_repository(self, app_name: str, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Create the repository for an app ahead of deployment, so it can run
+        while the app is still being generated.
+        """
+        repo_name = self._generate_repo_name(app_name)
+        repo = self._new_repository(repo_name, metadata or {})
+        logger.info(f"Prepared repository ahead of deployment: {repo.name}")
+        return repo
+
+    def delete_repository(self, repo) -> bool:
+        """Delete a prepared repository that will not be deployed to"""
+        try:
+            repo.delete()
+            logger.info(f"Deleted unused repository: {repo.name}")
+            return True
+        except GithubException as e:
+            logger.error(f"Failed to delete repository {repo.name}: status={getattr(e, 'status', None)} data={getattr(e, 'data', None)}")
+            return False
+
+    def _report(self, on_progress: Optional[Callable[..., None]], stage: str, status: str, **detail):
+        """Forward deployment progress to a listener without letting it break the deploy"""
+        if on_progress is None:
+            return
+        try:
+            on_progress(stage, status, **detail)
+        except Exception as e:
+            logger.warning(f"Progress listener failed for {stage}: {e}")
+
     def _generate_repo_name(self, app_name: str) -> str:
         """Generate a unique repository name"""
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         clean_name = "".join(c for c in app_name if c.isalnum() or c in ('-', '_')).lower()
         return f"llm-app-{clean_name}-{timestamp}"
 
+    def _existing_repository(self, repo_name: str):
+        """The owner's repository `repo_name`, or None if it was deleted"""
+        try:
+            return self.github.get_repo(f"{self.owner.login}/{repo_name}")
+        except GithubException as e:
+            if getattr(e, "status", None) != 404:
+                raise
+            logger.warning(f"Repository {repo_name} no longer exists; deploying to a new one")
+            return None
+
+    def _new_repository(self, repo_name: str, metadata: Dict[str, Any]):
+        """Claim a pooled repository under `repo_name`, creating one if the pool is empty"""
+        description = metadata.get("description", "LLM Generated Web Application")
+        repo = self.repo_pool.claim(repo_name, description)
+        if repo is None:
+            repo = self._create_repository(repo_name, metadata)
+        return repo
+
     def _create_repository(self, repo_name: str, metadata: Dict[str, Any]):
         """Create a new GitHub repository under authenticated user"""
         description = metadata.get("description", "LLM Generated Web Application")
@@ -129,43 +249,216 @@ class GitHubHelper:
                     files[name] = content
         return files
 
-    def _commit_files(self, repo, files: Dict[str, str], is_revision: bool = False) -> str:
-        """Commit or update files in repo"""
+    def _commit_files(
+        self,
+        repo,
+        files: Dict[str, str],
+        is_revision: bool = False,
+        on_progress: Optional[Callable[..., None]] = None
+    ) -> str:
+        """
+        Commit the files that changed as a single commit through the Git Data
+        API: one blob per changed file, then one tree, one commit and one ref
+        update, so a deploy triggers a single Pages build. Files whose local
+        git blob SHA matches the branch's tree are not uploaded; when nothing
+        changed no commit is made and the current head SHA is returned.
+        """
         default_branch = repo.default_branch or "main"
-        last_commit_sha = None
+        message = "Update app files" if is_revision else "Add app files"
+        # Retried as a whole (never per blob, so retries do not multiply). Blobs are content-addressed,
+        # so ones uploaded before a failed attempt are not sent again
+        uploaded: Dict[str, str] = {}
+        return self._with_retries(
+            lambda: self._commit_changes(repo, default_branch, files, message, is_revision, uploaded, on_progress)
+        )
 
-        for file_path, content in files.items():
-            attempts_remaining = 5
-            while attempts_remaining > 0:
+    def _commit_changes(
+        self,
+        repo,
+        branch: str,
+        files: Dict[str, str],
+        message: str,
+        keep_existing: bool,
+        uploaded: Dict[str, str],
+        on_progress: Optional[Callable[..., None]] = None
+    ) -> str:
+        ref = repo.get_git_ref(f"heads/{branch}")
+        parent = repo.get_git_commit(ref.object.sha)
+        listing = self._tree_listing(repo, parent)
+        shas = {path: git_blob_sha(content) for path, content in files.items()}
+        changed = [path for path in files if listing.get(path) != shas[path]]
+        self.stats["blobs_unchanged"] += len(files) - len(changed)
+        if not changed:
+            self.stats["commits_skipped"] += 1
+            logger.info(f"No file changes for {repo.name}; keeping commit {parent.sha}")
+            self._report(on_progress, "commit", "skipped", commit_sha=parent.sha, files=0)
+            return parent.sha
+
+        pending = [path for path in changed if shas[path] not in uploaded]
+        if pending:
+            futures = {
+                self._upload_pool.submit(self._upload_blob, repo.full_name, files[path]): path
+                for path in pending
+            }
+            failure: Optional[Exception] = None
+            for future in as_completed(futures):
+                path = futures[future]
                 try:
-                    try:
-                        existing_file = repo.get_contents(file_path, ref=default_branch)
-                        update = repo.update_file(
-                            path=file_path,
-                            message=("Update file " + file_path) if is_revision else ("Add file " + file_path),
-                            content=content,
-                            sha=existing_file.sha,
-                            branch=default_branch
-                        )
-                        last_commit_sha = update["commit"].sha
-                    except GithubException as ge:
-                        if getattr(ge, 'status', None) == 404:
-                            created = repo.create_file(
-                                path=file_path,
-                                message="Add file " + file_path,
-                                content=content,
-                                branch=default_branch
-                            )
-                            last_commit_sha = created["commit"].sha
-                        else:
-                            raise
-                    break
-                except Exception:
-                    attempts_remaining -= 1
-                    time.sleep(1)
-                    if attempts_remaining <= 0:
-                        raise
-        return last_commit_sha or ""
+                    uploaded[shas[path]] = future.result()
+                except Exception as e:
+                    # Keep collecting the other uploads so a retry only re-sends what failed
+                    failure = failure or e
+                    continue
+                self.stats["blobs_uploaded"] += 1
+                self._report(on_progress, "blob", "completed", path=path)
+            if failure is not None:
+                raise failure
+        elements = [
+            InputGitTreeElement(path=path, mode="100644", type="blob", sha=uploaded[shas[path]])
+            for path in changed
+        ]
+
+        # The base tree is only needed when files outside this commit must be kept: revisions
+        # (e.g. data files from earlier rounds) or unchanged files that were not re-sent
+        if keep_existing or len(changed) < len(files):
+            tree = repo.create_git_tree(elements, base_tree=parent.tree)
+            new_listing = {**listing, **{path: uploaded[shas[path]] for path in changed}}
+        else:
+            # A new repo only holds the auto_init README, which is replaced anyway
+            tree = repo.create_git_tree(elements)
+            new_listing = {path: uploaded[shas[path]] for path in changed}
+        commit = repo.create_git_commit(message, tree, [parent])
+        # Not forced: if the branch moved meanwhile this fails and the retry rebuilds on the new head
+        try:
+            ref.edit(commit.sha)
+        except GithubException as e:
+            if e.status == 422:
+                raise BranchMovedError(f"{repo.name}@{branch} moved while committing: {e}") from e
+            raise
+        self._cache_tree(repo.full_name, commit.sha, tree.sha, new_listing)
+        self.stats["commits"] += 1
+        logger.info(f"Committed {len(elements)} of {len(files)} files to {repo.name}@{branch}: {commit.sha}")
+        self._report(on_progress, "commit", "completed", commit_sha=commit.sha, files=len(elements))
+        return commit.sha
+
+    def _upload_blob(self, full_name: str, content: str) -> str:
+        """Create one blob from an upload worker; returns its SHA (retries happen around the whole commit)"""
+        repo = self._thread_repo(full_name)
+        with self._repo_slot(full_name):
+            return repo.create_git_blob(content, "utf-8").sha
+
+    def _thread_repo(self, full_name: str):
+        """`full_name` bound to this thread's own client, so its connections are reused across uploads"""
+        local = self._local
+        if getattr(local, "github", None) is None:
+            local.github = Github(self.token)
+            local.repos = {}
+        repo = local.repos.get(full_name)
+        if repo is None:
+            repo = local.github.get_repo(full_name, lazy=True)
+            local.repos[full_name] = repo
+        return repo
+
+    def _repo_slot(self, full_name: str) -> threading.BoundedSemaphore:
+        with self._repo_slots_lock:
+            slots = self._repo_slots.get(full_name)
+            if slots is None:
+                slots = threading.BoundedSemaphore(self.repo_concurrency)
+                self._repo_slots[full_name] = slots
+            return slots
+
+    def _tree_listing(self, repo, commit) -> Dict[str, str]:
+        """{path: blob sha} of `commit`, from the cache when it is still the head we last saw"""
+        key = repo.full_name
+        with self._tree_lock:
+            cached = self._tree_cache.get(key)
+            if cached is not None and cached[0] == commit.sha:
+                self._tree_cache.move_to_end(key)
+                self.stats["tree_cache_hits"] += 1
+                return dict(cached[2])
+        tree = repo.get_git_tree(commit.sha, recursive=True)
+        self.stats["tree_fetches"] += 1
+        listing = {element.path: element.sha for element in tree.tree if element.type == "blob"}
+        self._cache_tree(repo.full_name, commit.sha, tree.sha, listing)
+        return listing
+
+    def _cached_tree(self, full_name: str) -> Optional[Tuple[str, str, Dict[str, str]]]:
+        with self._tree_lock:
+            cached = self._tree_cache.get(full_name)
+            return (cached[0], cached[1], dict(cached[2])) if cached else None
+
+    def _cache_tree(self, full_name: str, commit_sha: str, tree_sha: Optional[str], listing: Dict[str, str]):
+        if not self.tree_cache_size:
+            return
+        with self._tree_lock:
+            self._tree_cache[full_name] = (commit_sha, tree_sha, dict(listing))
+            self._tree_cache.move_to_end(full_name)
+            while len(self._tree_cache) > self.tree_cache_size:
+                self._tree_cache.popitem(last=False)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._tree_lock:
+            cached_trees = len(self._tree_cache)
+        return {
+            **self.stats,
+            "cached_trees": cached_trees,
+            "upload_workers": self.upload_workers,
+            "repo_concurrency": self.repo_concurrency,
+            "repo_pool": self.repo_pool.get_metrics(),
+        }
+
+    def shutdown(self):
+        self.repo_pool.stop()
+        self._upload_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _with_retries(self, fn: Callable[[], Any]):
+        """Call `fn`, retrying transient failures up to GITHUB_RETRY_ATTEMPTS times with jittered backoff"""
+        for attempt in range(self.retry_attempts):
+            try:
+                return fn()
+            except Exception as e:
+                if attempt + 1 >= self.retry_attempts or not self._should_retry(e):
+                    raise
+                delay = self._retry_delay(attempt, e)
+                self.stats["retries"] += 1
+                logger.warning(f"GitHub call failed, retrying in {delay:.2f}s (attempt {attempt + 2}/{self.retry_attempts}): {e}")
+                time.sleep(delay)
+
+    @staticmethod
+    def _is_rate_limited(error: Exception) -> bool:
+        headers = getattr(error, "headers", None) or {}
+        return bool(headers.get("retry-after")) or headers.get("x-ratelimit-remaining") == "0"
+
+    def _should_retry(self, error: Exception) -> bool:
+        """
+        Transient failures only: server errors, 408/409/429, 403s that carry
+        rate limit headers, a branch that moved under the commit, and network
+        errors (requests raises OSError subclasses). Other 4xx are permanent.
+        """
+        if isinstance(error, BranchMovedError):
+            return True
+        status = getattr(error, "status", None)
+        if status is not None:
+            return status in RETRYABLE_STATUS or status >= 500 or (status == 403 and self._is_rate_limited(error))
+        return isinstance(error, OSError)
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """
+        Rate limit responses are waited out as GitHub asks (Retry-After for
+        secondary limits, the reset time once the primary quota is spent);
+        anything else gets full-jitter exponential backoff. Either way the
+        wait is capped at GITHUB_RETRY_MAX_DELAY, so an upload worker is never
+        held for a quota reset far past the request deadline.
+        """
+        headers = getattr(error, "headers", None) or {}
+        try:
+            if headers.get("retry-after"):
+                return min(self.retry_max_delay, max(0.0, float(headers["retry-after"])))
+            if headers.get("x-ratelimit-remaining") == "0" and headers.get("x-ratelimit-reset"):
+                return min(self.retry_max_delay, max(0.0, float(headers["x-ratelimit-reset"]) - time.time()))
+        except (TypeError, ValueError):
+            pass
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
 
     def _enable_github_pages(self, repo) -> str:
         """Return expected GitHub Pages URL"""
@@ -196,7 +489,7 @@ Open `index.html` in your browser to run the app.
 - `styles.css` - CSS (optional)
 - `script.js` - JS (optional)
 
-Generated on {datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")}
+Generated on {datetime.utcnow().strftime("%Y-%m-%d")}
 """
 
     def _generate_license(self) -> str:
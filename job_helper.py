@@ -0,0 +1,359 @@
+"""
+Job Helper Module for running deployment pipelines as background jobs
+Tracks stage-by-stage progress so clients can poll instead of holding a connection open.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Tuple
+
+from scheduler_helper import FairScheduler
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# Requests are considered duplicates when (email, task, round, nonce) match
+DedupKey = Tuple[str, str, int, str]
+
+
+class JobHelper:
+    def __init__(self, store=None):
+        """
+        JOB_WORKERS caps how many pipelines run at once, shared fairly between
+        tenants (request emails) by FairScheduler; JOB_MAX_HISTORY caps
+        how many finished jobs are kept in memory for polling. When a store
+        (DBHelper) is given, jobs and stage results are also persisted there
+        by its writer thread; finished jobs are pruned from it once older
+        than JOB_RETENTION_HOURS (checked every JOB_PRUNE_INTERVAL_SECONDS).
+        Duplicate submissions attach to the in-flight job, and completed jobs
+        stay attachable for DEDUP_TTL_SECONDS.
+        """
+        self.store = store
+        self.max_workers = max(1, int(os.getenv("JOB_WORKERS", "32")))
+        self.max_history = max(1, int(os.getenv("JOB_MAX_HISTORY", "10000")))
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._tasks: set = set()
+        self.scheduler = FairScheduler(capacity=self.max_workers)
+        self.dedup_ttl = float(os.getenv("DEDUP_TTL_SECONDS", "600"))
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._job_keys: Dict[str, DedupKey] = {}
+        self._inflight: Dict[DedupKey, str] = {}
+        self._recent: "OrderedDict[DedupKey, Tuple[str, float]]" = OrderedDict()
+        self.dedup_hits = 0
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        retention_hours = float(os.getenv("JOB_RETENTION_HOURS", "168"))
+        if store is not None and retention_hours > 0:
+            store.add_periodic(
+                float(os.getenv("JOB_PRUNE_INTERVAL_SECONDS", "3600")),
+                lambda: store.prune_jobs([JOB_COMPLETED, JOB_FAILED], retention_hours * 3600),
+            )
+
+    def create_job(
+        self,
+        request_info: Dict[str, Any],
+        payload: Optional[Dict[str, Any]] = None,
+        job_id: Optional[str] = None
+    ) -> str:
+        """
+        Register a job and return its id. `payload` is the full request persisted
+        for crash recovery; pass `job_id` to re-register a recovered job.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = datetime.utcnow().isoformat()
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "status": JOB_QUEUED,
+            "created_at": now,
+            "updated_at": now,
+            "request": request_info,
+            "stages": {},
+            "result": None,
+            "error": None,
+        }
+        self._evict_finished()
+        self._persist(lambda: self.store.save_job(job_id, payload or request_info, JOB_QUEUED))
+        return job_id
+
+    def submit(
+        self,
+        request_info: Dict[str, Any],
+        runner: Callable[[str], Awaitable[Dict[str, Any]]],
+        payload: Optional[Dict[str, Any]] = None,
+        job_id: Optional[str] = None,
+        dedup_key: Optional[DedupKey] = None
+    ) -> str:
+        """
+        Create a job and schedule `runner(job_id)` on the background worker pool.
+        The runner's return value becomes the job result. When `dedup_key`
+        matches an in-flight or recently completed job, that job's id is
+        returned instead and nothing new is scheduled.
+        """
+        if dedup_key is not None:
+            existing = self.find_duplicate(dedup_key)
+            if existing is not None:
+                self.dedup_hits += 1
+                logger.info(f"Duplicate request {dedup_key} attached to job {existing}")
+                return existing
+
+        loop = asyncio.get_running_loop()
+        job_id = self.create_job(request_info, payload=payload, job_id=job_id)
+        self._futures[job_id] = loop.create_future()
+        if dedup_key is not None:
+            self._inflight[dedup_key] = job_id
+            self._job_keys[job_id] = dedup_key
+        tenant = str(request_info.get("email") or "anonymous").lower()
+        task = loop.create_task(self._run(job_id, runner, tenant))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"Queued job {job_id}")
+        return job_id
+
+    def find_duplicate(self, dedup_key: DedupKey) -> Optional[str]:
+        """Job id for an in-flight or unexpired completed job with this key"""
+        job_id = self._inflight.get(dedup_key)
+        if job_id is not None:
+            return job_id
+        self._purge_recent()
+        cached = self._recent.get(dedup_key)
+        return cached[0] if cached else None
+
+    def _purge_recent(self):
+        now = time.monotonic()
+        while self._recent:
+            key, (_, expires_at) = next(iter(self._recent.items()))
+            if expires_at > now and len(self._recent) <= self.max_history:
+                break
+            self._recent.popitem(last=False)
+
+    def _release_key(self, job_id: str, completed: bool):
+        """Move a finished job's key from in-flight to the TTL cache (successes only)"""
+        dedup_key = self._job_keys.pop(job_id, None)
+        if dedup_key is None:
+            return
+        if self._inflight.get(dedup_key) == job_id:
+            del self._inflight[dedup_key]
+        if completed and self.dedup_ttl > 0:
+            self._recent[dedup_key] = (job_id, time.monotonic() + self.dedup_ttl)
+            self._recent.move_to_end(dedup_key)
+            self._purge_recent()
+
+    async def wait(self, job_id: str) -> Dict[str, Any]:
+        """
+        Wait for a job and return its result. Several callers can wait on the
+        same job; cancelling one waiter does not cancel the job.
+        """
+        future = self._futures.get(job_id)
+        if future is not None:
+            return await asyncio.shield(future)
+        job = await self.aget_job(job_id)
+        if job is None:
+            raise KeyError(f"Job {job_id} not found")
+        if job["status"] == JOB_COMPLETED:
+            return job["result"]
+        raise RuntimeError(job.get("error") or f"Job {job_id} is {job['status']}")
+
+    async def _run(self, job_id: str, runner: Callable[[str], Awaitable[Dict[str, Any]]], tenant: str):
+        await self.scheduler.acquire(tenant)
+        try:
+            self._set_status(job_id, JOB_RUNNING)
+            try:
+                result = await runner(job_id)
+                self.complete_job(job_id, result)
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+                self.fail_job(job_id, str(e))
+        finally:
+            self.scheduler.release(tenant)
+
+    def record_stage(self, job_id: str, stage: str, stage_status: str, **detail):
+        """Record progress of a pipeline stage (started/streaming/completed/failed/skipped)"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        now = datetime.utcnow().isoformat()
+        entry = job["stages"].setdefault(stage, {})
+        if stage_status == "started":
+            entry["started_at"] = now
+        elif stage_status != "streaming":
+            entry["finished_at"] = now
+        entry["status"] = stage_status
+        entry.update(detail)
+        job["updated_at"] = now
+        self._publish(job_id, {"event": "stage", "stage": stage, "status": stage_status, "timestamp": now, **detail})
+
+    def complete_job(self, job_id: str, result: Dict[str, Any]):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job["result"] = result
+        self._set_status(job_id, JOB_COMPLETED)
+        self._persist(lambda: self.store.update_job(job_id, JOB_COMPLETED, result=result))
+        self._release_key(job_id, completed=True)
+        future = self._futures.get(job_id)
+        if future is not None and not future.done():
+            future.set_result(result)
+        self._publish(job_id, {"event": "result", "result": result}, final=True)
+
+    def fail_job(self, job_id: str, error: str):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job["error"] = error
+        self._set_status(job_id, JOB_FAILED)
+        self._persist(lambda: self.store.update_job(job_id, JOB_FAILED, error=error))
+        self._release_key(job_id, completed=False)
+        future = self._futures.get(job_id)
+        if future is not None and not future.done():
+            future.set_exception(RuntimeError(error))
+            # Mark retrieved so an unobserved failure does not log "exception never retrieved"
+            future.exception()
+        self._publish(job_id, {"event": "error", "error": error}, final=True)
+
+    # ------------------------ Progress subscriptions ------------------------
+    async def subscribe(self, job_id: str) -> asyncio.Queue:
+        """
+        Queue of progress events for a job. Stages that already happened are
+        replayed first; the last event is always "result" or "error".
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        job = await self.aget_job(job_id)
+        if job is not None:
+            for stage, entry in job["stages"].items():
+                queue.put_nowait({"event": "stage", "stage": stage, "replayed": True, **entry})
+            if job["status"] == JOB_COMPLETED:
+                queue.put_nowait({"event": "result", "result": job["result"]})
+                return queue
+            if job["status"] == JOB_FAILED:
+                queue.put_nowait({"event": "error", "error": job.get("error")})
+                return queue
+        self._subscribers.setdefault(job_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(job_id)
+        if queues and queue in queues:
+            queues.remove(queue)
+            if not queues:
+                del self._subscribers[job_id]
+
+    def _publish(self, job_id: str, event: Dict[str, Any], final: bool = False):
+        queues = self._subscribers.pop(job_id, []) if final else self._subscribers.get(job_id, [])
+        for queue in queues:
+            queue.put_nowait(event)
+
+    def _set_status(self, job_id: str, job_status: str):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job["status"] = job_status
+            job["updated_at"] = datetime.utcnow().isoformat()
+        if job_status == JOB_RUNNING:
+            self._persist(lambda: self.store.update_job(job_id, JOB_RUNNING))
+
+    def _persist(self, write: Callable[[], Any]):
+        """Queue a store write for its writer thread; persistence problems are logged, never raised"""
+        if self.store is None:
+            return
+        try:
+            self.store.defer(write)
+        except Exception as e:
+            logger.error(f"Job store write failed: {e}")
+
+    # ------------------------ Stage results (crash recovery) ------------------------
+    def save_stage_result(self, job_id: str, stage: str, data: Dict[str, Any]):
+        self._persist(lambda: self.store.save_stage_result(job_id, stage, data))
+
+    def get_stage_results(self, job_id: str) -> Dict[str, Dict[str, Any]]:
+        if self.store is None:
+            return {}
+        try:
+            return self.store.get_stage_results(job_id)
+        except Exception as e:
+            logger.error(f"Failed to load stage results for job {job_id}: {e}")
+            return {}
+
+    def get_unfinished_jobs(self) -> List[Dict[str, Any]]:
+        """Persisted jobs that were queued or running when the process stopped"""
+        if self.store is None:
+            return []
+        try:
+            return self.store.get_unfinished_jobs([JOB_QUEUED, JOB_RUNNING])
+        except Exception as e:
+            logger.error(f"Failed to load unfinished jobs: {e}")
+            return []
+
+    def _evict_finished(self):
+        """Drop the oldest finished jobs once history exceeds max_history"""
+        if len(self._jobs) <= self.max_history:
+            return
+        for job_id in list(self._jobs.keys()):
+            if len(self._jobs) <= self.max_history:
+                break
+            if self._jobs[job_id]["status"] in (JOB_COMPLETED, JOB_FAILED):
+                del self._jobs[job_id]
+                self._futures.pop(job_id, None)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        return self._stored_job(job_id)
+
+    async def aget_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """get_job for the event loop: the store fallback runs in the default executor"""
+        job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        return await asyncio.get_running_loop().run_in_executor(None, self._stored_job, job_id)
+
+    def _stored_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Evicted or from a previous process: rebuild a summary from the store"""
+        try:
+            stored = self.store.get_job(job_id)
+        except Exception as e:
+            logger.error(f"Failed to load job {job_id}: {e}")
+            return None
+        if stored is None:
+            return None
+        request = stored.pop("request", {}) or {}
+        stored["request"] = {key: request.get(key) for key in ("email", "task", "round", "nonce")}
+        stored["stages"] = {stage: {"status": "completed"} for stage in self.get_stage_results(job_id)}
+        return stored
+
+    def get_jobs(self, job_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        return {job_id: self.get_job(job_id) for job_id in job_ids}
+
+    async def aget_jobs(self, job_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """get_jobs for the event loop: jobs not held in memory are loaded in one executor call"""
+        jobs = {job_id: self._jobs.get(job_id) for job_id in job_ids}
+        missing = [job_id for job_id, job in jobs.items() if job is None]
+        if missing and self.store is not None:
+            stored = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: {job_id: self._stored_job(job_id) for job_id in missing}
+            )
+            jobs.update(stored)
+        return jobs
+
+    def get_metrics(self) -> Dict[str, Any]:
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_COMPLETED: 0, JOB_FAILED: 0}
+        for job in self._jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "workers": self.max_workers,
+            "tracked": len(self._jobs),
+            **counts,
+            "dedup": {
+                "hits": self.dedup_hits,
+                "inflight_keys": len(self._inflight),
+                "cached_keys": len(self._recent),
+                "ttl_seconds": self.dedup_ttl,
+            },
+        }
@@ -4,27 +4,115 @@ Includes deterministic builders for specific briefs to avoid external dependency
 """
 
 import os
+import csv
 import json
+import time
+import asyncio
+import hashlib
+import itertools
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Any, Optional, Tuple
 
 try:
-    from openai import OpenAI  # type: ignore
+    from openai import OpenAI, AsyncOpenAI  # type: ignore
 except Exception:  # openai may be absent or fail when not configured
     OpenAI = None  # type: ignore
+    AsyncOpenAI = None  # type: ignore
+
+try:
+    import httpx  # type: ignore
+except Exception:
+    httpx = None  # type: ignore
+
+try:
+    import tiktoken  # type: ignore
+except Exception:  # optional: exact token counts for OpenAI-family models
+    tiktoken = None  # type: ignore
 
 from pydantic import BaseModel
 
+from builder_helper import BuilderRegistry
+from cache_helper import ResponseCache
+from template_helper import TemplateHelper
+from resilience_helper import CircuitBreaker, RetryPolicy
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = (
+    "You are an expert web developer. "
+    "Always respond in strict JSON format with keys: "
+    "html_content, css_content, js_content, metadata."
+)
+
+PATCH_SYSTEM_PROMPT = (
+    "You are an expert web developer revising an existing app. "
+    "Always respond in strict JSON format with keys: edits, metadata. "
+    "Each edit is an object with keys file, search, replace."
+)
+
+TEMPERATURE = 0.6
+
+# Files a revision patch may edit, and the GeneratedApp field each one maps to
+PATCHABLE_FILES = {
+    "index.html": "html_content",
+    "styles.css": "css_content",
+    "script.js": "js_content",
+}
+
+# Weight of the newest sample in the moving average of semaphore wait time
+WAIT_EWMA_ALPHA = 0.2
+
+# Rough characters-per-token ratio used to size attachment summaries
+CHARS_PER_TOKEN = 4
+
+# MIME types whose decoded content is text even though they are not text/*
+TEXT_MIME_TYPES = {
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "application/x-yaml",
+    "image/svg+xml",
+}
+
+TEXT_EXTENSIONS = (".csv", ".tsv", ".md", ".markdown", ".txt", ".json", ".xml", ".yaml", ".yml", ".html", ".css", ".js", ".svg")
+
+
+# Smallest per-attachment budget the prompt trimmer will shrink to
+MIN_ATTACHMENT_TOKENS = 50
+
+# Context window (prompt + completion tokens) per model; override or extend
+# with LLM_CONTEXT_WINDOWS="model=tokens,..." and LLM_DEFAULT_CONTEXT_WINDOW
+DEFAULT_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "claude-3": 200000,
+    "gemini": 1000000,
+    "llama-3": 8192,
+    "qwq-32b": 32768,
+    "qwen": 32768,
+    "mistral": 32768,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
 
 class AppGenerationRequest(BaseModel):
     task: str
     brief: str
     round: int = 1
     attachments: Optional[List[Dict[str, Any]]] = None
+    # Files of the previous round ({"index.html": ..., "styles.css": ..., "script.js": ...});
+    # when set, revisions are generated as edits against them
+    prior_files: Optional[Dict[str, str]] = None
 
 
 class GeneratedApp(BaseModel):
@@ -35,80 +123,999 @@ class GeneratedApp(BaseModel):
     extra_files: Optional[Dict[str, str]] = None
 
 
+class IncrementalAppParser:
+    """
+    Incremental parser for the JSON object a streamed completion produces.
+    Captures top-level string fields as soon as their closing quote arrives and
+    flags output that can no longer become a single JSON object, so the caller
+    can abort the stream instead of paying for the rest of it.
+    """
+
+    SCALAR_CHARS = set("0123456789+-.eEtrufalsn")
+    WHITESPACE = set(" \t\r\n")
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.complete = False
+        self.chars_seen = 0
+        self._started = False
+        self._depth = 0
+        self._expect = "key"  # at depth 1: key, colon, value, scalar or comma
+        self._key: Optional[str] = None
+        self._in_string = False
+        self._escape = False
+        self._string_role: Optional[str] = None  # "key", "value" or None inside nested values
+        self._chars: List[str] = []
+
+    def feed(self, chunk: str) -> List[str]:
+        """Consume the next chunk; returns the top-level string fields completed by it"""
+        completed: List[str] = []
+        for ch in chunk:
+            if self.error:
+                break
+            self.chars_seen += 1
+            if self._in_string:
+                self._string_char(ch, completed)
+            elif not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                elif ch not in self.WHITESPACE:
+                    self.error = f"response does not start with a JSON object (got {ch!r})"
+            elif self.complete:
+                if ch not in self.WHITESPACE:
+                    self.error = "trailing data after JSON object"
+            elif self._depth > 1:
+                self._nested_char(ch)
+            else:
+                self._top_level_char(ch)
+        return completed
+
+    def _string_char(self, ch: str, completed: List[str]):
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._string_role is not None:
+                try:
+                    value = json.loads('"' + "".join(self._chars) + '"')
+                except json.JSONDecodeError as e:
+                    self.error = f"invalid string literal: {e}"
+                    return
+                if self._string_role == "key":
+                    self._key = value
+                    self._expect = "colon"
+                else:
+                    self.fields[self._key] = value
+                    completed.append(self._key)
+                    self._expect = "comma"
+                self._chars = []
+            return
+        if self._string_role is not None:
+            self._chars.append(ch)
+
+    def _nested_char(self, ch: str):
+        if ch == '"':
+            self._in_string = True
+            self._string_role = None
+        elif ch in "{[":
+            self._depth += 1
+        elif ch in "}]":
+            self._depth -= 1
+            if self._depth == 1:
+                self._expect = "comma"
+
+    def _top_level_char(self, ch: str):
+        if self._expect == "scalar":
+            if ch in self.SCALAR_CHARS:
+                return
+            self._expect = "comma"
+        if ch in self.WHITESPACE:
+            return
+        if self._expect == "key":
+            if ch == '"':
+                self._in_string = True
+                self._string_role = "key"
+            elif ch == "}":
+                self._close()
+            else:
+                self.error = f"expected object key, got {ch!r}"
+        elif self._expect == "colon":
+            if ch == ":":
+                self._expect = "value"
+            else:
+                self.error = f"expected ':', got {ch!r}"
+        elif self._expect == "value":
+            if ch == '"':
+                self._in_string = True
+                self._string_role = "value"
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in self.SCALAR_CHARS:
+                self._expect = "scalar"
+            else:
+                self.error = f"expected value, got {ch!r}"
+        elif self._expect == "comma":
+            if ch == ",":
+                self._expect = "key"
+            elif ch == "}":
+                self._close()
+            else:
+                self.error = f"expected ',' or '}}', got {ch!r}"
+
+    def _close(self):
+        self._depth = 0
+        self.complete = True
+
+
+class TokenBudget:
+    """
+    Measures prompts offline, decides how much of the context window a prompt
+    may use and how many completion tokens to request, and keeps token usage
+    metrics. Token counts come from tiktoken when LLM_TOKENIZER=tiktoken and it
+    is installed, otherwise from the chars/4 heuristic.
+    """
+
+    def __init__(self):
+        self.tokenizer = "heuristic"
+        self._encoding = None
+        if os.getenv("LLM_TOKENIZER", "heuristic").lower() == "tiktoken":
+            if tiktoken is None:
+                logger.warning("LLM_TOKENIZER=tiktoken but tiktoken is not installed; using heuristic")
+            else:
+                try:
+                    self._encoding = tiktoken.get_encoding(os.getenv("LLM_TIKTOKEN_ENCODING", "cl100k_base"))
+                    self.tokenizer = "tiktoken"
+                except Exception as e:
+                    logger.warning(f"Failed to load tiktoken encoding, using heuristic: {e}")
+
+        self.context_windows = dict(DEFAULT_CONTEXT_WINDOWS)
+        for item in os.getenv("LLM_CONTEXT_WINDOWS", "").split(","):
+            model, _, value = item.rpartition("=")
+            if model.strip() and value.strip().isdigit():
+                self.context_windows[model.strip()] = int(value)
+        self.default_context_window = int(os.getenv("LLM_DEFAULT_CONTEXT_WINDOW", "32768"))
+        self.max_output = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "4000"))
+        self.min_output = min(self.max_output, int(os.getenv("LLM_MIN_OUTPUT_TOKENS", "1024")))
+        self.output_headroom = float(os.getenv("LLM_OUTPUT_HEADROOM", "1.5"))
+        self.safety_margin = int(os.getenv("LLM_CONTEXT_SAFETY_TOKENS", "256"))
+
+        # Recent completion sizes per task, used to size max_tokens for revisions
+        self.history_size = 10
+        self.max_history_tasks = 1000
+        # (task, mode) -> recent completion sizes; patch and full outputs differ a lot in size
+        self._history: "OrderedDict[Tuple[str, str], deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "trimmed_prompts": 0,
+            "truncated_completions": 0,
+        }
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        # ~4 tokens of chat framing per message
+        return sum(self.count(m.get("content", "")) + 4 for m in messages)
+
+    def truncate(self, text: str, max_tokens: int, marker: str = " ... [truncated]") -> str:
+        if self.count(text) <= max_tokens:
+            return text
+        keep = max(0, max_tokens - self.count(marker))
+        if self._encoding is not None:
+            return self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:keep]) + marker
+        return text[:keep * CHARS_PER_TOKEN] + marker
+
+    def context_window(self, model: str) -> int:
+        """Exact match, then without the provider prefix, then longest known prefix"""
+        if model in self.context_windows:
+            return self.context_windows[model]
+        name = model.split("/")[-1].split(":")[0]
+        if name in self.context_windows:
+            return self.context_windows[name]
+        prefixes = [key for key in self.context_windows if name.startswith(key)]
+        if prefixes:
+            return self.context_windows[max(prefixes, key=len)]
+        return self.default_context_window
+
+    def prompt_limit(self, model: str) -> int:
+        """Most prompt tokens that still leave room for the minimum completion"""
+        return self.context_window(model) - self.min_output - self.safety_margin
+
+    def max_tokens(self, model: str, prompt_tokens: int, task: Optional[str] = None, mode: str = "full") -> int:
+        """
+        Completion budget: headroom over the largest recent completion for this
+        task in this mode (LLM_MAX_OUTPUT_TOKENS when there is none), capped by
+        what is left of the model's context window after the prompt.
+        """
+        room = self.context_window(model) - prompt_tokens - self.safety_margin
+        with self._lock:
+            history = self._history.get((task, mode)) if task else None
+            wanted = (
+                max(self.min_output, int(max(history) * self.output_headroom))
+                if history else self.max_output
+            )
+        return max(1, min(wanted, self.max_output, room))
+
+    def record(
+        self,
+        model: str,
+        task: Optional[str],
+        prompt_tokens: int,
+        content: str,
+        usage: Optional[Dict[str, Any]] = None,
+        mode: str = "full"
+    ):
+        """Account one completion; provider-reported usage wins over local estimates"""
+        usage = usage or {}
+        prompt = usage.get("prompt_tokens") or prompt_tokens
+        completion = usage.get("completion_tokens") or self.count(content or "")
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["prompt_tokens"] += prompt
+            self.stats["completion_tokens"] += completion
+            if usage.get("finish_reason") == "length":
+                self.stats["truncated_completions"] += 1
+            if task:
+                history = self._history.pop((task, mode), None) or deque(maxlen=self.history_size)
+                history.append(completion)
+                self._history[(task, mode)] = history
+                while len(self._history) > self.max_history_tasks:
+                    self._history.popitem(last=False)
+        logger.info(f"Token usage on {model}: prompt={prompt} completion={completion}")
+
+    def note_trim(self):
+        with self._lock:
+            self.stats["trimmed_prompts"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = self.stats["calls"]
+            return {
+                "tokenizer": self.tokenizer,
+                "max_output_tokens": self.max_output,
+                **self.stats,
+                "avg_prompt_tokens": round(self.stats["prompt_tokens"] / calls, 1) if calls else 0.0,
+                "avg_completion_tokens": round(self.stats["completion_tokens"] / calls, 1) if calls else 0.0,
+            }
+
+
 class LLMHelper:
     def __init__(self):
         """
         Initializes OpenRouter/OpenAI-compatible client when API key is available.
+        The async client (used by agenerate_app) is created on first use.
         """
         api_key = os.getenv("OPENAI_API_KEY")
+        self.api_key = api_key
+        self.base_url = os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
         self.client = None
         if api_key and OpenAI is not None:
             self.client = OpenAI(
                 api_key=api_key,
-                base_url=os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1"),
+                base_url=self.base_url,
+                max_retries=0,  # retries are handled by self.retry_policy
             )
 
         self.model = os.getenv("OPENAI_MODEL", "arliai/qwq-32b-arliai-rpr-v1:free")
         logger.info(f"Using model: {self.model}")
 
-    def generate_app(self, request: AppGenerationRequest) -> GeneratedApp:
+        # Async provider access: one pooled client shared by all requests
+        self.async_client = None
+        self.max_concurrency = max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "32")))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.inflight = 0
+        self.waiting = 0
+        self.recent_wait = 0.0
+        # ticket -> time each provider call still waiting for the semaphore started waiting
+        self._waiting_since: Dict[int, float] = {}
+        self._wait_tickets = itertools.count()
+
+        # Identical prompts (retries, repeated briefs) are answered from the cache
+        self.cache = ResponseCache()
+
+        # Stream completions so malformed output is caught (and the call
+        # aborted) after the first bad token instead of after max_tokens
+        self.streaming = os.getenv("LLM_STREAMING", "false").lower() == "true"
+        self.stream_stats = {"streams": 0, "aborted": 0, "completed_early": 0}
+
+        # Hedged generation: if the primary model has not produced a valid app
+        # after LLM_HEDGE_DELAY_SECONDS, race the same prompt on the next model
+        self.hedge_models = [
+            m.strip() for m in os.getenv("OPENAI_HEDGE_MODELS", "").split(",")
+            if m.strip() and m.strip() != self.model
+        ]
+        self.hedge_delay = max(0.0, float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "5")))
+        self.model_stats: Dict[str, Dict[str, float]] = {}
+
+        # One circuit breaker per model so a degraded provider fails fast
+        # (straight to the deterministic/fallback path) instead of timing out
+        self.retry_policy = RetryPolicy()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+        # Attachments are summarized into the prompt, each within this many tokens
+        self.attachment_token_budget = max(50, int(os.getenv("LLM_ATTACHMENT_TOKEN_BUDGET", "800")))
+        self.attachment_sample_rows = max(0, int(os.getenv("LLM_ATTACHMENT_SAMPLE_ROWS", "5")))
+
+        # Prompt sizing against the model's context window and dynamic max_tokens
+        self.token_budget = TokenBudget()
+
+        # Revisions as search/replace edits against the previous round's files
+        self.patch_revisions = os.getenv("LLM_PATCH_REVISIONS", "true").lower() == "true"
+        self.patch_max_tokens = max(1, int(os.getenv("LLM_PATCH_MAX_TOKENS", "1500")))
+        self.patch_stats = {"attempts": 0, "applied": 0, "fallbacks": 0}
+
+        # Zero-LLM fast path: briefs scored against every builder's triggers at once
+        self.builders = BuilderRegistry()
+        self._register_builders()
+        self.templates = TemplateHelper()
+        # Builder output memoized by builder name + attachment contents
+        self.builder_memo_size = max(0, int(os.getenv("BUILDER_MEMO_SIZE", "256")))
+        self._builder_memo: "OrderedDict[str, GeneratedApp]" = OrderedDict()
+        self._builder_memo_lock = threading.Lock()
+        self.builder_memo_stats = {"hits": 0, "misses": 0}
+
+    # ------------------------ Provider calls ------------------------
+    def _build_messages(self, request: AppGenerationRequest) -> List[Dict[str, str]]:
         """
-        Generate complete web app based on user brief.
-        Uses deterministic builders for known briefs, otherwise uses LLM if configured.
+        Build the chat messages, trimming to the model's context window: first
+        shrink the per-attachment budget, then truncate the brief.
         """
-        brief_lower = (request.brief or "").lower()
+        build = self._build_initial_prompt if request.round == 1 else self._build_revision_prompt
+        budget = self.token_budget
+        limit = budget.prompt_limit(self.model) - budget.count_messages([{"content": SYSTEM_PROMPT}, {"content": ""}])
+        attachment_budget = self.attachment_token_budget
+        prompt = build(request, attachment_budget)
+        tokens = budget.count(prompt)
+        trimmed = False
+        while tokens > limit and request.attachments and attachment_budget > MIN_ATTACHMENT_TOKENS:
+            attachment_budget = max(MIN_ATTACHMENT_TOKENS, attachment_budget // 2)
+            prompt = build(request, attachment_budget)
+            tokens = budget.count(prompt)
+            trimmed = True
+        if tokens > limit and request.brief:
+            keep = max(0, budget.count(request.brief) - (tokens - limit))
+            prompt = build(request.model_copy(update={"brief": budget.truncate(request.brief, keep)}), attachment_budget)
+            tokens = budget.count(prompt)
+            trimmed = True
+        if trimmed:
+            budget.note_trim()
+            logger.warning(f"Trimmed prompt to {tokens} tokens for {self.model} (limit {limit})")
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+
+    def _build_patch_messages(self, request: AppGenerationRequest) -> Optional[List[Dict[str, str]]]:
+        """Patch-mode messages for a revision, or None when the prior files don't fit the context"""
+        prompt = self._build_patch_prompt(request)
+        messages = [
+            {"role": "system", "content": PATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        if self.token_budget.count_messages(messages) > self.token_budget.prompt_limit(self.model):
+            logger.info("Prior files too large for a patch prompt; regenerating in full")
+            return None
+        return messages
+
+    def _generation_plans(
+        self,
+        request: AppGenerationRequest
+    ) -> List[Tuple[str, List[Dict[str, str]], Optional[Callable[[str], GeneratedApp]], Optional[int]]]:
+        """
+        (mode, messages, parser, max_tokens cap) to try in order: a patch against
+        the prior round's files when available, then full generation.
+        """
+        plans = []
+        if self.patch_revisions and request.round > 1 and request.prior_files:
+            messages = self._build_patch_messages(request)
+            if messages is not None:
+                prior_files = request.prior_files
+                plans.append(("patch", messages, lambda content: self._apply_patch(prior_files, content), self.patch_max_tokens))
+        plans.append(("full", self._build_messages(request), None, None))
+        return plans
+
+    def _patch_failed(self, reason: Any):
+        self.patch_stats["fallbacks"] += 1
+        logger.warning(f"Patch revision not usable, regenerating in full: {reason}")
+
+    def _request_args(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        task: Optional[str],
+        timeout: Optional[float],
+        max_tokens: Optional[int] = None,
+        mode: str = "full"
+    ) -> Tuple[Dict[str, Any], int]:
+        """Per-call completion arguments (max_tokens, timeout) and the prompt token count"""
+        prompt_tokens = self.token_budget.count_messages(messages)
+        limit = self.token_budget.max_tokens(model, prompt_tokens, task, mode)
+        args: Dict[str, Any] = {"max_tokens": min(limit, max_tokens) if max_tokens else limit}
+        if timeout is not None:
+            args["timeout"] = timeout
+        return args, prompt_tokens
+
+    @staticmethod
+    def _read_usage(response, usage: Dict[str, Any]):
+        if getattr(response, "usage", None) is not None:
+            usage["prompt_tokens"] = response.usage.prompt_tokens
+            usage["completion_tokens"] = response.usage.completion_tokens
+        if response.choices:
+            usage["finish_reason"] = response.choices[0].finish_reason
+
+    def _cache_key(self, messages: List[Dict[str, str]], model: Optional[str] = None) -> str:
+        """Cache key of `messages` on `model` (default: the primary model), the model that produced the response"""
+        return ResponseCache.make_key(model or self.model, messages[0]["content"], messages[1]["content"], TEMPERATURE)
+
+    def _cached_app(self, cache_key: str, parse: Optional[Callable[[str], GeneratedApp]] = None) -> Optional[GeneratedApp]:
+        content = self.cache.get(cache_key)
+        if content is None:
+            return None
         try:
-            if "sum-of-sales" in brief_lower or "sales" in brief_lower:
-                return self._build_sum_of_sales_app(request)
-            if "markdown-to-html" in brief_lower or "markdown" in brief_lower:
-                return self._build_markdown_to_html_app(request)
-            if "github-user" in brief_lower:
-                return self._build_github_user_created_app(request)
+            logger.info("Serving generated app from LLM response cache")
+            return (parse or self._parse_app_content)(content)
         except Exception as e:
-            logger.error(f"Deterministic builder failed, trying LLM if available: {e}")
+            logger.warning(f"Ignoring unparseable cached response: {e}")
+            return None
+
+    def _parse_and_cache(
+        self,
+        content: str,
+        cache_key: str,
+        parse: Optional[Callable[[str], GeneratedApp]] = None
+    ) -> GeneratedApp:
+        """Parse a completion and cache it only if it produced a valid app"""
+        app = (parse or self._parse_app_content)(content)
+        if self.validate_generated_app(app):
+            self.cache.set(cache_key, content)
+        return app
+
+    def _parse_app_content(self, content: str) -> GeneratedApp:
+        try:
+            app_data = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON from LLM: {e}")
+            raise ValueError("Invalid JSON response from OpenRouter API")
+        return GeneratedApp(
+            html_content=app_data.get("html_content", ""),
+            css_content=app_data.get("css_content", ""),
+            js_content=app_data.get("js_content", ""),
+            metadata=app_data.get("metadata", {}),
+        )
+
+    def generate_app(self, request: AppGenerationRequest, timeout: Optional[float] = None) -> GeneratedApp:
+        """
+        Generate complete web app based on user brief.
+        Uses deterministic builders for known briefs, otherwise uses LLM if configured.
+        `timeout` (seconds) bounds the provider call.
+        """
+        ready, plans = self._prepare_generation(request)
+        if ready is not None:
+            return ready
 
         if not self.client:
             raise RuntimeError("LLM client not configured and no deterministic builder matched")
 
         try:
-            prompt = (
-                self._build_initial_prompt(request)
-                if request.round == 1
-                else self._build_revision_prompt(request)
-            )
+            for index, (mode, messages, parse, max_tokens) in enumerate(plans):
+                final = index == len(plans) - 1
+                logger.info(f"Generating app (Round {request.round}, {mode}) using {self.model}")
+                if mode == "patch":
+                    self.patch_stats["attempts"] += 1
+                try:
+                    app = self._complete(messages, request.task, timeout, parse, max_tokens, mode)
+                except Exception as e:
+                    if final:
+                        raise
+                    self._patch_failed(e)
+                    continue
+                if final or self.validate_generated_app(app):
+                    if mode == "patch":
+                        self.patch_stats["applied"] += 1
+                    return app
+                self._patch_failed("patched app failed validation")
+        except Exception as e:
+            logger.error(f"App generation failed: {e}")
+            raise
+
+    def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        task: Optional[str],
+        timeout: Optional[float],
+        parse: Optional[Callable[[str], GeneratedApp]] = None,
+        max_tokens: Optional[int] = None,
+        mode: str = "full"
+    ) -> GeneratedApp:
+        """One synchronous provider completion (with retries) parsed into an app"""
+        extra_args, prompt_tokens = self._request_args(self.model, messages, task, timeout, max_tokens, mode)
+        usage: Dict[str, Any] = {}
 
-            logger.info(f"Generating app (Round {request.round}) using {self.model}")
+        def complete() -> str:
+            if self.streaming:
+                return self._stream_completion(messages, extra_args)
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an expert web developer. "
-                            "Always respond in strict JSON format with keys: "
-                            "html_content, css_content, js_content, metadata."
-                        ),
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.6,
-                max_tokens=4000,
+                messages=messages,
+                temperature=TEMPERATURE,
+                **extra_args,
             )
-            content = response.choices[0].message.content
-            app_data = json.loads(content)
-            return GeneratedApp(
-                html_content=app_data.get("html_content", ""),
-                css_content=app_data.get("css_content", ""),
-                js_content=app_data.get("js_content", ""),
-                metadata=app_data.get("metadata", {}),
-            )
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON from LLM: {e}")
+            self._read_usage(response, usage)
+            return response.choices[0].message.content
+
+        content = self.retry_policy.call(complete, self._breaker(self.model), budget=timeout)
+        self.token_budget.record(self.model, task, prompt_tokens, content, usage, mode)
+        return self._parse_and_cache(content, self._cache_key(messages), parse)
+
+    def _stream_completion(self, messages: List[Dict[str, str]], extra_args: Dict[str, Any]) -> str:
+        """
+        Streamed completion parsed as it arrives. Aborts the stream on the first
+        chunk that makes the JSON invalid and stops reading once the object closes.
+        """
+        self.stream_stats["streams"] += 1
+        parser = IncrementalAppParser()
+        parts: List[str] = []
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            stream=True,
+            **extra_args,
+        )
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                parser.feed(delta)
+                if parser.error or parser.complete:
+                    break
+        finally:
+            stream.response.close()
+        return self._finish_stream(parser, parts)
+
+    def _finish_stream(self, parser: IncrementalAppParser, parts: List[str]) -> str:
+        if parser.error:
+            self.stream_stats["aborted"] += 1
+            logger.error(f"Aborted LLM stream after {parser.chars_seen} chars: {parser.error}")
             raise ValueError("Invalid JSON response from OpenRouter API")
+        if parser.complete:
+            self.stream_stats["completed_early"] += 1
+        return "".join(parts)
+
+    def _get_async_client(self):
+        """
+        Shared AsyncOpenAI client over one pooled httpx client with keep-alive
+        and explicit connect/read timeouts (LLM_* env vars).
+        """
+        if self.async_client is None and self.api_key and AsyncOpenAI is not None and httpx is not None:
+            limits = httpx.Limits(
+                max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+                keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30")),
+            )
+            timeout = httpx.Timeout(
+                float(os.getenv("LLM_READ_TIMEOUT", "120")),
+                connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+            )
+            self.async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+                max_retries=0,
+            )
+        return self.async_client
+
+    @property
+    def supports_async(self) -> bool:
+        return bool(self.api_key) and AsyncOpenAI is not None and httpx is not None
+
+    async def agenerate_app(
+        self,
+        request: AppGenerationRequest,
+        timeout: Optional[float] = None,
+        on_field: Optional[Callable[[str], None]] = None
+    ) -> GeneratedApp:
+        """
+        Async variant of generate_app on the shared pooled client. Each may
+        race the hedge models (OPENAI_HEDGE_MODELS); every model attempt holds
+        one of the LLM_MAX_CONCURRENCY provider call slots. When streaming,
+        `on_field` is called with each top-level field name as it completes.
+        """
+        # Builders, attachment packing, prompt building and cache reads take tens to hundreds of
+        # milliseconds on large attachments; keep them off the event loop
+        ready, plans = await asyncio.get_running_loop().run_in_executor(None, self._prepare_generation, request)
+        if ready is not None:
+            return ready
+
+        client = self._get_async_client()
+        if client is None:
+            raise RuntimeError("LLM client not configured and no deterministic builder matched")
+
+        try:
+            for index, (mode, messages, parse, max_tokens) in enumerate(plans):
+                final = index == len(plans) - 1
+                logger.info(f"Generating app (Round {request.round}, {mode}) using {self.model} (async)")
+                if mode == "patch":
+                    self.patch_stats["attempts"] += 1
+                try:
+                    app = await self._race_models(
+                        client, messages, request.task, timeout, on_field, parse, max_tokens, mode
+                    )
+                except Exception as e:
+                    if final:
+                        raise
+                    self._patch_failed(e)
+                    continue
+                if final or self.validate_generated_app(app):
+                    if mode == "patch":
+                        self.patch_stats["applied"] += 1
+                    return app
+                self._patch_failed("patched app failed validation")
         except Exception as e:
             logger.error(f"App generation failed: {e}")
             raise
 
+    async def _acquire_slot(self):
+        """Wait for one of the LLM_MAX_CONCURRENCY provider call slots"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        queued_at = time.monotonic()
+        ticket = next(self._wait_tickets)
+        self._waiting_since[ticket] = queued_at
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            self._waiting_since.pop(ticket, None)
+        waited = time.monotonic() - queued_at
+        self.recent_wait = WAIT_EWMA_ALPHA * waited + (1 - WAIT_EWMA_ALPHA) * self.recent_wait
+        self.inflight += 1
+
+    def _release_slot(self, _attempt=None):
+        self.inflight -= 1
+        self._semaphore.release()
+
+    def _slots_full(self) -> bool:
+        return self._semaphore is not None and self._semaphore.locked()
+
+    async def _race_models(
+        self,
+        client,
+        messages: List[Dict[str, str]],
+        task: Optional[str] = None,
+        timeout: Optional[float] = None,
+        on_field: Optional[Callable[[str], None]] = None,
+        parse: Optional[Callable[[str], GeneratedApp]] = None,
+        max_tokens: Optional[int] = None,
+        mode: str = "full"
+    ) -> GeneratedApp:
+        """
+        Start the primary model, then one more hedge model every hedge_delay
+        seconds (or at once when an attempt fails). The first app that passes
+        validation wins and the remaining attempts are cancelled. If none is
+        valid, the first invalid app is returned (or the last error raised).
+        Each attempt holds a provider call slot; a hedge is skipped rather
+        than queued when no slot is free and another attempt is still running.
+        The winning response is cached under the model that produced it.
+        """
+        models = [self.model] + self.hedge_models
+        next_model = 0
+        pending: set = set()
+        invalid_app: Optional[GeneratedApp] = None
+        last_error: Optional[Exception] = None
+        try:
+            while True:
+                if next_model < len(models):
+                    model = models[next_model]
+                    next_model += 1
+                    if pending and self._slots_full():
+                        # Hedging now would only add load to a provider that is already slow
+                        self._model_stat(model)["skipped"] += 1
+                        logger.info(f"Skipping hedge on {model}: all {self.max_concurrency} provider slots busy")
+                    else:
+                        if next_model > 1:
+                            logger.info(f"Hedging generation with {model}")
+                        await self._acquire_slot()
+                        attempt = asyncio.ensure_future(
+                            self._attempt_model(client, model, messages, task, timeout, on_field, parse, max_tokens, mode)
+                        )
+                        # Released however the attempt ends, even if it is cancelled before it starts
+                        attempt.add_done_callback(self._release_slot)
+                        pending.add(attempt)
+                wait = self.hedge_delay if next_model < len(models) else None
+                done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    try:
+                        model, content, app = attempt.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if self.validate_generated_app(app):
+                        self._model_stat(model)["wins"] += 1
+                        # The disk tier writes a file; keep that off the event loop
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, self.cache.set, self._cache_key(messages, model), content
+                        )
+                        if model != self.model:
+                            logger.info(f"Hedge model {model} won the race")
+                        return app
+                    self._model_stat(model)["invalid"] += 1
+                    if invalid_app is None:
+                        invalid_app = app
+                if not pending and next_model >= len(models):
+                    break
+        finally:
+            for attempt in pending:
+                attempt.cancel()
+        if invalid_app is not None:
+            return invalid_app
+        raise last_error or RuntimeError("No model produced a response")
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(f"llm:{model}")
+            self.breakers[model] = breaker
+        return breaker
+
+    def circuit_open(self) -> bool:
+        """True while every configured model's breaker is open (calls would fail fast)"""
+        return all(self._breaker(model).is_open() for model in [self.model] + self.hedge_models)
+
+    def _model_stat(self, model: str) -> Dict[str, float]:
+        stats = self.model_stats.get(model)
+        if stats is None:
+            stats = {
+                "attempts": 0, "completed": 0, "wins": 0, "invalid": 0, "failed": 0, "cancelled": 0, "skipped": 0,
+                "total_latency": 0.0,
+            }
+            self.model_stats[model] = stats
+        return stats
+
+    async def _attempt_model(
+        self,
+        client,
+        model: str,
+        messages: List[Dict[str, str]],
+        task: Optional[str] = None,
+        timeout: Optional[float] = None,
+        on_field: Optional[Callable[[str], None]] = None,
+        parse: Optional[Callable[[str], GeneratedApp]] = None,
+        max_tokens: Optional[int] = None,
+        mode: str = "full"
+    ) -> Tuple[str, str, GeneratedApp]:
+        """One generation on `model` (retried per retry_policy); returns (model, raw content, parsed app)"""
+        stats = self._model_stat(model)
+        stats["attempts"] += 1
+        started = time.monotonic()
+        extra_args, prompt_tokens = self._request_args(model, messages, task, timeout, max_tokens, mode)
+        usage: Dict[str, Any] = {}
+
+        async def complete() -> str:
+            if self.streaming:
+                return await self._astream_completion(client, model, messages, extra_args, on_field)
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=TEMPERATURE,
+                **extra_args,
+            )
+            self._read_usage(response, usage)
+            return response.choices[0].message.content
+
+        try:
+            content = await self.retry_policy.acall(complete, self._breaker(model), budget=timeout)
+            self.token_budget.record(model, task, prompt_tokens, content, usage, mode)
+            app = (parse or self._parse_app_content)(content)
+        except asyncio.CancelledError:
+            stats["cancelled"] += 1
+            raise
+        except Exception as e:
+            stats["failed"] += 1
+            logger.warning(f"Generation attempt on {model} failed: {e}")
+            raise
+        stats["completed"] += 1
+        stats["total_latency"] += time.monotonic() - started
+        return model, content, app
+
+    async def _astream_completion(
+        self,
+        client,
+        model: str,
+        messages: List[Dict[str, str]],
+        extra_args: Dict[str, Any],
+        on_field: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Async counterpart of _stream_completion"""
+        self.stream_stats["streams"] += 1
+        parser = IncrementalAppParser()
+        parts: List[str] = []
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            stream=True,
+            **extra_args,
+        )
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                for field in parser.feed(delta):
+                    if on_field is not None:
+                        on_field(field)
+                if parser.error or parser.complete:
+                    break
+        finally:
+            await stream.response.aclose()
+        return self._finish_stream(parser, parts)
+
+    async def aclose(self):
+        """Close the pooled async client"""
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+
+    def oldest_wait(self) -> float:
+        """Seconds the longest-waiting provider call has been queued for the semaphore (0 when none is)"""
+        waiting = list(self._waiting_since.values())
+        return time.monotonic() - min(waiting) if waiting else 0.0
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "recent_wait_ms": round(1000 * self.recent_wait, 2),
+            "oldest_wait_ms": round(1000 * self.oldest_wait(), 2),
+            "streaming": {"enabled": self.streaming, **self.stream_stats},
+            "hedge_models": self.hedge_models,
+            "hedge_delay_seconds": self.hedge_delay,
+            "models": {model: self._model_metrics(stats) for model, stats in self.model_stats.items()},
+            "breakers": {model: breaker.get_metrics() for model, breaker in self.breakers.items()},
+            "retries": self.retry_policy.get_metrics(),
+            "tokens": self.token_budget.get_metrics(),
+            "builders": {**self.builders.get_metrics(), "memo": dict(self.builder_memo_stats)},
+            "patch_revisions": {"enabled": self.patch_revisions, **self.patch_stats},
+            "cache": self.cache.get_metrics(),
+        }
+
+    @staticmethod
+    def _model_metrics(stats: Dict[str, float]) -> Dict[str, Any]:
+        metrics = {k: v for k, v in stats.items() if k != "total_latency"}
+        metrics["win_rate"] = round(stats["wins"] / stats["attempts"], 4) if stats["attempts"] else 0.0
+        metrics["avg_latency_ms"] = (
+            round(1000 * stats["total_latency"] / stats["completed"], 2) if stats["completed"] else 0.0
+        )
+        return metrics
+
+    def _register_builders(self):
+        """
+        Trigger weights: the task slug or a builder-specific element id is
+        enough on its own (>= BUILDER_MIN_SCORE); generic words like "sales"
+        or "markdown" only count together with other evidence.
+        """
+        self.builders.register("sum-of-sales", self._build_sum_of_sales_app, {
+            "sum-of-sales": 10,
+            "total-sales": 5,
+            "sales summary": 4,
+            "product-sales": 3,
+            "region-filter": 2,
+            "currency-picker": 2,
+            "data.csv": 2,
+            "sales": 2,
+            "sum": 1,
+        })
+        self.builders.register("markdown-to-html", self._build_markdown_to_html_app, {
+            "markdown-to-html": 10,
+            "markdown-output": 5,
+            "markdown to html": 5,
+            "input.md": 3,
+            "markdown": 3,
+            "markdown-tabs": 2,
+            "markdown-source": 2,
+            "marked": 2,
+            "highlight.js": 2,
+        })
+        self.builders.register("github-user-created", self._build_github_user_created_app, {
+            "github-user": 10,
+            "github-created-at": 5,
+            "api.github.com/users": 4,
+            "github user": 4,
+            "github-status": 2,
+            "created_at": 2,
+            "account age": 2,
+            "github": 1,
+            "username": 1,
+        })
+
+    def _memoized_build(self, name: str, build: Callable[..., GeneratedApp], request: AppGenerationRequest) -> GeneratedApp:
+        """
+        Builders depend only on the attachments, so identical attachments reuse
+        the earlier output. Callers get a copy and may mutate it freely.
+        """
+        if not self.builder_memo_size:
+            return build(request)
+        raw = json.dumps([name, request.attachments or []], sort_keys=True, default=str)
+        key = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        with self._builder_memo_lock:
+            app = self._builder_memo.get(key)
+            if app is not None:
+                self._builder_memo.move_to_end(key)
+                self.builder_memo_stats["hits"] += 1
+                return app.model_copy(deep=True)
+            self.builder_memo_stats["misses"] += 1
+        app = build(request)
+        with self._builder_memo_lock:
+            self._builder_memo[key] = app.model_copy(deep=True)
+            while len(self._builder_memo) > self.builder_memo_size:
+                self._builder_memo.popitem(last=False)
+        return app
+
+    def _match_text(self, request: AppGenerationRequest) -> str:
+        names = " ".join(
+            str(a.get("name", "")) for a in request.attachments or [] if isinstance(a, dict)
+        )
+        return f"{request.task} {request.brief or ''} {names}"
+
+    def generate_deterministic(self, request: AppGenerationRequest) -> Optional[GeneratedApp]:
+        """
+        Build the app without the LLM when a deterministic builder matches the brief.
+        Returns None when no builder matches (or the builder fails).
+        """
+        match = self.builders.match(self._match_text(request))
+        if match is None:
+            return None
+        name, build, score = match
+        try:
+            logger.info(f"Using deterministic builder {name} (score {score:g})")
+            return self._memoized_build(name, build, request)
+        except Exception as e:
+            self.builders.record_failure(name)
+            logger.error(f"Deterministic builder failed, trying LLM if available: {e}")
+        return None
+
+    def cached_app(self, request: AppGenerationRequest) -> Optional[GeneratedApp]:
+        """A cached LLM response for `request` (patch or full), without calling the provider"""
+        return self._cached_plan_app(self._generation_plans(request))
+
+    def _cached_plan_app(self, plans) -> Optional[GeneratedApp]:
+        # Responses are cached per producing model, so a hedge model's winning answer is found too
+        for _, messages, parse, _ in plans:
+            for model in [self.model] + self.hedge_models:
+                cached = self._cached_app(self._cache_key(messages, model), parse)
+                if cached is not None:
+                    return cached
+        return None
+
+    def _prepare_generation(self, request: AppGenerationRequest) -> Tuple[Optional[GeneratedApp], list]:
+        """
+        (app, plans): a deterministic or cached app when there is one, plus the
+        generation plans to run otherwise. Blocking CPU and disk work only.
+        """
+        deterministic = self.generate_deterministic(request)
+        if deterministic is not None:
+            return deterministic, []
+        plans = self._generation_plans(request)
+        return self._cached_plan_app(plans), plans
+
     # ------------------------ Deterministic builders ------------------------
     def _decode_data_url(self, url: str) -> Tuple[str, str]:
         try:
@@ -143,66 +1150,7 @@ class LLMHelper:
     def _build_sum_of_sales_app(self, request: AppGenerationRequest) -> GeneratedApp:
         files = self._collect_attachments(request)
         data_csv = files.get("data.csv", "")
-        html = (
-            "<!doctype html><html><head><meta charset=\"utf-8\">"
-            "<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">"
-            "<title>Sales Summary</title>"
-            "<link rel=\"stylesheet\" href=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css\">"
-            "</head><body class=\"p-4\">"
-            "<div class=\"container\">"
-            "<h1 class=\"mb-3\">Sales Summary</h1>"
-            "<div class=\"mb-2\">Total: <span id=\"total-sales\">0</span> <span id=\"total-currency\"></span></div>"
-            "<div class=\"mb-3\">"
-            "<label class=\"form-label\" for=\"region-filter\">Region</label>"
-            "<select id=\"region-filter\" class=\"form-select\"><option value=\"all\">All</option></select>"
-            "</div>"
-            "<div class=\"mb-3\">"
-            "<label class=\"form-label\" for=\"currency-picker\">Currency</label>"
-            "<select id=\"currency-picker\" class=\"form-select\"><option value=\"USD\">USD</option></select>"
-            "</div>"
-            "<table id=\"product-sales\" class=\"table table-striped\"><thead><tr><th>Product</th><th>Sales</th></tr></thead><tbody></tbody></table>"
-            "</div>"
-            "<script src=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js\"></script>"
-            "<script>"
-            "(function(){\n"
-            "  function parseCSV(text){\n"
-            "    const lines=text.trim().split(/\\r?\\n/);\n"
-            "    const header=lines.shift().split(',').map(s=>s.trim());\n"
-            "    return lines.map(l=>{const cols=l.split(',');const o={};header.forEach((h,i)=>o[h]=cols[i]);return o;});\n"
-            "  }\n"
-            "  async function loadData(){\n"
-            "    let csv='';\n"
-            "    try{csv=await fetch('data.csv').then(r=>r.text());}catch(e){}\n"
-            "    const rows = csv ? parseCSV(csv) : [];\n"
-            "    const tbody=document.querySelector('#product-sales tbody');\n"
-            "    const regionSel=document.getElementById('region-filter');\n"
-            "    const regions = new Set(['all']);\n"
-            "    for(const r of rows){\n"
-            "      const p=r.product||r.Product||'Unknown';\n"
-            "      const s=parseFloat(r.sales||r.Sales||0)||0;\n"
-            "      const region=r.region||r.Region||'all'; regions.add(region);\n"
-            "      const tr=document.createElement('tr'); tr.innerHTML=`<td>${p}</td><td>${s.toFixed(2)}</td>`; tr.dataset.region=region; tbody.appendChild(tr);\n"
-            "    }\n"
-            "    for(const r of regions){ if(r==='all') continue; const opt=document.createElement('option'); opt.value=r; opt.textContent=r; regionSel.appendChild(opt);}\n"
-            "    function computeTotal(){\n"
-            "      const region=regionSel.value; let sum=0;\n"
-            "      [...tbody.querySelectorAll('tr')].forEach(tr=>{ if(region==='all'||tr.dataset.region===region){ sum+=parseFloat(tr.children[1].textContent)||0; } });\n"
-            "      const el=document.getElementById('total-sales'); el.textContent=sum.toFixed(2); el.dataset.region=region;\n"
-            "    }\n"
-            "    regionSel.addEventListener('change', computeTotal);\n"
-            "    computeTotal();\n"
-            "    const picker=document.getElementById('currency-picker'); const totalCur=document.getElementById('total-currency');\n"
-            "    let rates={USD:1};\n"
-            "    try{ rates = await fetch('rates.json').then(r=>r.json()); }catch(e){}\n"
-            "    function applyCurrency(){ const rate=rates[picker.value]||1; const base=parseFloat(document.getElementById('total-sales').textContent)||0; document.getElementById('total-sales').textContent=(base*rate).toFixed(2); totalCur.textContent = ' '+picker.value; }\n"
-            "    picker.addEventListener('change', applyCurrency);\n"
-            "    if(typeof seed!=='undefined'){ document.title = `Sales Summary ${seed}`; }\n"
-            "  }\n"
-            "  loadData();\n"
-            "})();\n"
-            "</script>"
-            "</body></html>"
-        )
+        html = self.templates.render("sum_of_sales.html")
         extra_files: Dict[str, str] = {}
         if data_csv:
             extra_files["data.csv"] = data_csv
@@ -212,44 +1160,7 @@ class LLMHelper:
     def _build_markdown_to_html_app(self, request: AppGenerationRequest) -> GeneratedApp:
         files = self._collect_attachments(request)
         input_md = files.get("input.md", "")
-        html = (
-            "<!doctype html><html><head><meta charset=\"utf-8\"><meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">"
-            "<title>Markdown Viewer</title>"
-            "<link rel=\"stylesheet\" href=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css\">"
-            "<link rel=\"stylesheet\" href=\"https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.9.0/styles/github-dark.min.css\">"
-            "</head><body class=\"p-4\">"
-            "<div class=\"container\">"
-            "<div class=\"mb-3\" id=\"markdown-tabs\">"
-            "<button class=\"btn btn-primary me-2\" data-target=\"output\">Rendered</button>"
-            "<button class=\"btn btn-outline-secondary\" data-target=\"source\">Source</button>"
-            "<span id=\"markdown-source-label\" class=\"ms-3 text-muted\"></span>"
-            "<span id=\"markdown-word-count\" class=\"badge bg-secondary ms-3\">0</span>"
-            "</div>"
-            "<div id=\"markdown-output\" class=\"mb-3\"></div>"
-            "<pre id=\"markdown-source\" class=\"p-3 bg-light border\"></pre>"
-            "</div>"
-            "<script src=\"https://cdnjs.cloudflare.com/ajax/libs/marked/11.1.1/marked.min.js\"></script>"
-            "<script src=\"https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.9.0/highlight.min.js\"></script>"
-            "<script>"
-            "(function(){\n"
-            "  function wordCount(s){ return (s.trim().match(/\\S+/g)||[]).length; }\n"
-            "  async function loadMarkdown(){\n"
-            "    const params=new URLSearchParams(location.search);\n"
-            "    const url=params.get('url');\n"
-            "    let md=''; let sourceLabel='attachment';\n"
-            "    try{ md = url ? await fetch(url).then(r=>r.text()) : await fetch('input.md').then(r=>r.text()); sourceLabel = url ? url : 'attachment'; }catch(e){}\n"
-            "    document.getElementById('markdown-source').textContent = md;\n"
-            "    document.getElementById('markdown-output').innerHTML = marked.parse(md);\n"
-            "    document.getElementById('markdown-source-label').textContent = sourceLabel;\n"
-            "    document.getElementById('markdown-word-count').textContent = new Intl.NumberFormat().format(wordCount(md));\n"
-            "    document.querySelectorAll('pre code').forEach(el=>hljs.highlightElement(el));\n"
-            "  }\n"
-            "  document.getElementById('markdown-tabs').addEventListener('click', (e)=>{ const btn=e.target.closest('button'); if(!btn) return; const target=btn.getAttribute('data-target'); document.getElementById('markdown-output').style.display = target==='output'?'block':'none'; document.getElementById('markdown-source').style.display = target==='source'?'block':'none'; });\n"
-            "  loadMarkdown();\n"
-            "})();\n"
-            "</script>"
-            "</body></html>"
-        )
+        html = self.templates.render("markdown_to_html.html")
         extra_files: Dict[str, str] = {}
         if input_md:
             extra_files["input.md"] = input_md
@@ -257,51 +1168,12 @@ class LLMHelper:
         return GeneratedApp(html_content=html, css_content="", js_content="", metadata=metadata, extra_files=extra_files)
 
     def _build_github_user_created_app(self, request: AppGenerationRequest) -> GeneratedApp:
-        html = (
-            "<!doctype html><html><head><meta charset=\"utf-8\"><meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">"
-            "<title>GitHub User Info</title>"
-            "<link rel=\"stylesheet\" href=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css\">"
-            "</head><body class=\"p-4\">"
-            "<div class=\"container\">"
-            "<h1 class=\"mb-3\">GitHub User Info</h1>"
-            "<div id=\"github-status\" class=\"alert alert-info\" aria-live=\"polite\">Idle</div>"
-            "<form id=\"github-user-${seed}\" class=\"row g-2\">"
-            "<div class=\"col-auto\"><input id=\"gh-username\" class=\"form-control\" placeholder=\"Username\" required></div>"
-            "<div class=\"col-auto\"><button class=\"btn btn-primary\" type=\"submit\">Lookup</button></div>"
-            "</form>"
-            "<div class=\"mt-3\">Created: <span id=\"github-created-at\"></span> <span id=\"github-account-age\"></span></div>"
-            "</div>"
-            "<script>"
-            "(function(){\n"
-            "  const form=document.getElementById('github-user-${seed}');\n"
-            "  const statusEl=document.getElementById('github-status');\n"
-            "  const createdEl=document.getElementById('github-created-at');\n"
-            "  const ageEl=document.getElementById('github-account-age');\n"
-            "  const stored = localStorage.getItem('github-user-${seed}');\n"
-            "  if(stored){ try{ const d=JSON.parse(stored); document.getElementById('gh-username').value=d.username||''; }catch(e){} }\n"
-            "  form.addEventListener('submit', async (e)=>{ e.preventDefault(); const u=document.getElementById('gh-username').value.trim(); if(!u) return; statusEl.textContent='Starting lookup...';\n"
-            "    try{\n"
-            "      const params=new URLSearchParams(location.search); const token=params.get('token');\n"
-            "      const res = await fetch('https://api.github.com/users/'+encodeURIComponent(u), { headers: token? { Authorization: 'Bearer '+token } : {} });\n"
-            "      statusEl.textContent='Lookup complete';\n"
-            "      if(!res.ok){ createdEl.textContent=''; ageEl.textContent=''; return; }\n"
-            "      const data=await res.json();\n"
-            "      const created=new Date(data.created_at); const y=created.getUTCFullYear(); const m=String(created.getUTCMonth()+1).padStart(2,'0'); const d=String(created.getUTCDate()).padStart(2,'0');\n"
-            "      createdEl.textContent = `${y}-${m}-${d}`;\n"
-            "      const years = Math.max(0, Math.floor((Date.now()-created.getTime())/ (365*24*3600*1000)));\n"
-            "      ageEl.textContent = ` (${years} years)`;\n"
-            "      localStorage.setItem('github-user-${seed}', JSON.stringify({ username:u, created: data.created_at }));\n"
-            "    }catch(e){ statusEl.textContent='Failed'; createdEl.textContent=''; ageEl.textContent=''; }\n"
-            "  });\n"
-            "})();\n"
-            "</script>"
-            "</body></html>"
-        )
+        html = self.templates.render("github_user_created.html")
         metadata = {"title": "GitHub User Info"}
         return GeneratedApp(html_content=html, css_content="", js_content="", metadata=metadata)
 
     # ------------------------ Prompt builders ------------------------
-    def _build_initial_prompt(self, request: AppGenerationRequest) -> str:
+    def _build_initial_prompt(self, request: AppGenerationRequest, attachment_budget: Optional[int] = None) -> str:
         prompt = f"""
 Create a complete, minimal web app based on:
 
@@ -321,10 +1193,10 @@ Respond strictly as JSON with:
 - metadata (title, description)
 """
         if request.attachments:
-            prompt += f"\nAttachments:\n{json.dumps(request.attachments, indent=2)}"
+            prompt += f"\nAttachments:\n{self._pack_attachments(request, attachment_budget)}"
         return prompt
 
-    def _build_revision_prompt(self, request: AppGenerationRequest) -> str:
+    def _build_revision_prompt(self, request: AppGenerationRequest, attachment_budget: Optional[int] = None) -> str:
         prompt = f"""
 Revise the previous app as per feedback.
 
@@ -336,9 +1208,172 @@ Keep same functionality but improve UI/UX and fix issues.
 Respond with JSON (same keys as before).
 """
         if request.attachments:
-            prompt += f"\nRevision context:\n{json.dumps(request.attachments, indent=2)}"
+            prompt += f"\nRevision context:\n{self._pack_attachments(request, attachment_budget)}"
+        return prompt
+
+    def _build_patch_prompt(self, request: AppGenerationRequest) -> str:
+        current = "\n".join(
+            f"=== {name} ===\n{(request.prior_files or {}).get(name, '')}\n=== end {name} ==="
+            for name in PATCHABLE_FILES
+        )
+        prompt = f"""
+Revise the existing app as per the brief by editing its current files.
+
+TASK: {request.task}
+BRIEF: {request.brief}
+ROUND: {request.round}
+
+Current files:
+{current}
+
+Respond strictly as JSON with:
+- edits: list of {{"file": one of {", ".join(PATCHABLE_FILES)}, "search": text copied exactly from that file, "replace": new text}}
+- metadata (title, description)
+
+Each search must occur exactly once in its file. Keep edits small and do not repeat unchanged code.
+Use an empty search to replace a whole file (e.g. to fill an empty styles.css).
+"""
+        if request.attachments:
+            prompt += f"\nRevision context:\n{self._pack_attachments(request)}"
         return prompt
 
+    def _apply_patch(self, prior_files: Dict[str, str], content: str) -> GeneratedApp:
+        """Apply a search/replace edit list to the prior files; raises ValueError if any edit doesn't apply"""
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON patch: {e}")
+        edits = data.get("edits") if isinstance(data, dict) else None
+        if not isinstance(edits, list):
+            raise ValueError("Patch response has no edits list")
+        files = {name: prior_files.get(name, "") or "" for name in PATCHABLE_FILES}
+        for edit in edits:
+            name = edit.get("file") if isinstance(edit, dict) else None
+            if name not in files:
+                raise ValueError(f"Patch edits unknown file {name!r}")
+            search = edit.get("search") or ""
+            replace = edit.get("replace") or ""
+            if not search:
+                files[name] = replace
+                continue
+            count = files[name].count(search)
+            if count != 1 and search.strip() and files[name].count(search.strip()) == 1:
+                search, count = search.strip(), 1
+            if count != 1:
+                raise ValueError(f"Patch search text found {count} times in {name}")
+            files[name] = files[name].replace(search, replace, 1)
+        return GeneratedApp(
+            **{field: files[name] for name, field in PATCHABLE_FILES.items()},
+            metadata=data.get("metadata") or {},
+        )
+
+    # ------------------------ Attachment packing ------------------------
+    def _pack_attachments(self, request: AppGenerationRequest, token_budget: Optional[int] = None) -> str:
+        """
+        Describe attachments for the prompt instead of pasting their data URLs:
+        structured files are summarized, binaries referenced by name, and each
+        entry is held to `token_budget` (default attachment_token_budget) tokens.
+        """
+        token_budget = token_budget or self.attachment_token_budget
+        entries = []
+        for a in request.attachments or []:
+            if not isinstance(a, dict):
+                continue
+            name = a.get("name") or "attachment"
+            url = a.get("url") or ""
+            summary = self._summarize_attachment(name, url)
+            entries.append(self.token_budget.truncate(summary, token_budget, marker="\n  ... [truncated]"))
+        return "\n".join(entries)
+
+    def _summarize_attachment(self, name: str, url: str) -> str:
+        if not url.startswith("data:"):
+            return f"- {name}: {url} (linked file, not inlined)"
+        mime, text = self._decode_data_url(url)
+        mime = mime.split(";")[0].strip().lower() or "application/octet-stream"
+        lower_name = name.lower()
+        is_text = (
+            mime.startswith("text/")
+            or mime in TEXT_MIME_TYPES
+            or lower_name.endswith(TEXT_EXTENSIONS)
+        )
+        # Undecodable bytes become U+FFFD; a noticeable share means it is not text
+        if not is_text or text.count("\ufffd") > max(1, len(text) // 100):
+            return f"- {name} ({mime}): binary file, referenced by name only"
+
+        header = f"- {name} ({mime}, {self._format_size(len(text.encode('utf-8')))})"
+        if mime in ("text/csv", "text/tab-separated-values") or lower_name.endswith((".csv", ".tsv")):
+            return header + "\n" + self._summarize_csv(text, "\t" if lower_name.endswith(".tsv") else ",")
+        if mime == "text/markdown" or lower_name.endswith((".md", ".markdown")):
+            return header + "\n" + self._summarize_markdown(text)
+        if mime == "application/json" or lower_name.endswith(".json"):
+            return header + "\n" + self._summarize_json(text)
+        return header + "\n" + self._excerpt(text)
+
+    @staticmethod
+    def _format_size(size: int) -> str:
+        if size < 1024:
+            return f"{size} B"
+        if size < 1024 * 1024:
+            return f"{size / 1024:.1f} KB"
+        return f"{size / (1024 * 1024):.1f} MB"
+
+    def _summarize_csv(self, text: str, delimiter: str = ",") -> str:
+        rows = csv.reader(text.splitlines(), delimiter=delimiter)
+        header = next(rows, [])
+        samples: List[List[str]] = []
+        numeric = [True] * len(header)
+        row_count = 0
+        for row in rows:
+            if not any(cell.strip() for cell in row):
+                continue
+            row_count += 1
+            if len(samples) < max(self.attachment_sample_rows, 20):
+                samples.append(row)
+                for i, cell in enumerate(row[:len(header)]):
+                    if numeric[i] and cell.strip():
+                        try:
+                            float(cell.replace(",", ""))
+                        except ValueError:
+                            numeric[i] = False
+        columns = ", ".join(
+            f"{col} ({'number' if numeric[i] else 'text'})" for i, col in enumerate(header)
+        )
+        lines = [f"  CSV with {row_count} data rows; columns: {columns}"]
+        if self.attachment_sample_rows and samples:
+            lines.append("  sample rows:")
+            lines.extend(f"    {delimiter.join(row)}" for row in samples[:self.attachment_sample_rows])
+        return "\n".join(lines)
+
+    def _summarize_markdown(self, text: str) -> str:
+        lines = text.splitlines()
+        headings = [line.strip() for line in lines if line.lstrip().startswith("#")]
+        summary = [f"  Markdown with {len(lines)} lines"]
+        if headings:
+            summary.append("  headings:")
+            summary.extend(f"    {h}" for h in headings)
+        else:
+            summary.append(self._excerpt(text))
+        return "\n".join(summary)
+
+    def _summarize_json(self, text: str) -> str:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return self._excerpt(text)
+        if isinstance(data, dict):
+            shape = f"  JSON object with keys: {', '.join(map(str, data.keys()))}"
+        elif isinstance(data, list):
+            shape = f"  JSON array with {len(data)} items"
+        else:
+            shape = f"  JSON {type(data).__name__}"
+        return shape + "\n" + self._excerpt(text)
+
+    def _excerpt(self, text: str) -> str:
+        # Leave room for the header line within the attachment budget
+        limit = max(0, self.attachment_token_budget * CHARS_PER_TOKEN - 200)
+        body = text if len(text) <= limit else text[:limit].rstrip() + "\n... [truncated]"
+        return "  content:\n" + "\n".join(f"    {line}" for line in body.splitlines())
+
     def validate_generated_app(self, app: GeneratedApp) -> bool:
         try:
             if not app.html_content or "<html" not in app.html_content.lower():
@@ -0,0 +1 @@
+console.log('Fallback app initialized');
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+Repo Index Helper Module for remembering which GitHub repository serves each task
+Revision rounds deploy to the repository of the earlier rounds, so Pages URLs stay stable and commits stay incremental.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (email, task)
+IndexKey = Tuple[str, str]
+
+
+class RepoIndex:
+    def __init__(self, store=None):
+        """
+        Entries ({"repo_name", "commit_sha", "tree_sha", "files"}) are kept in
+        memory for the last REPO_INDEX_MAX_TASKS tasks and, when a store
+        (DBHelper) is given, persisted there so they survive restarts.
+        """
+        self.store = store
+        self.max_tasks = max(1, int(os.getenv("REPO_INDEX_MAX_TASKS", "1000")))
+        self._memory: "OrderedDict[IndexKey, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(email: str, task: str) -> IndexKey:
+        return ((email or "").strip().lower(), task or "")
+
+    def save(self, email: str, task: str, entry: Dict[str, Any]):
+        key = self._key(email, task)
+        with self._lock:
+            self._memory.pop(key, None)
+            self._memory[key] = dict(entry)
+            while len(self._memory) > self.max_tasks:
+                self._memory.popitem(last=False)
+        if self.store is not None:
+            try:
+                self.store.defer(lambda: self.store.save_repo_index(key[0], key[1], entry))
+            except Exception as e:
+                logger.error(f"Repo index write failed: {e}")
+
+    def get(self, email: str, task: str) -> Optional[Dict[str, Any]]:
+        key = self._key(email, task)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return dict(entry)
+        if self.store is None:
+            return None
+        try:
+            entry = self.store.get_repo_index(key[0], key[1])
+        except Exception as e:
+            logger.error(f"Failed to load repo index for {key[1]}: {e}")
+            return None
+        if entry is not None:
+            with self._lock:
+                self._memory[key] = dict(entry)
+                while len(self._memory) > self.max_tasks:
+                    self._memory.popitem(last=False)
+        return entry
@@ -0,0 +1,153 @@
+"""
+Repo Pool Helper Module for keeping pre-created GitHub repositories ready to deploy to
+A background thread keeps REPO_POOL_SIZE initialized repos; new apps claim and rename one instead of creating a repo.
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, Callable, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Names of pooled repos. App repos are always named llm-app-*, so no task name can produce this prefix
+POOL_PREFIX = "llm-pool-"
+
+# Description every pool repo is created with; adoption requires it as well as the prefix
+POOL_DESCRIPTION = "Reserved by the LLM app repository pool"
+
+
+def _created_ts(repo) -> float:
+    created_at = getattr(repo, "created_at", None)
+    if not isinstance(created_at, datetime):
+        return time.time()
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+
+class RepoPool:
+    def __init__(self, owner, create_repo: Callable[[str, str], Any], delete_repo: Callable[[Any], bool]):
+        """
+        create_repo(name, description) makes an initialized repo and
+        delete_repo(repo) removes one. Pool repos left by an earlier process
+        are adopted on start; repos unclaimed for REPO_POOL_MAX_AGE_SECONDS
+        are deleted and replaced.
+        """
+        self.owner = owner
+        self.create_repo = create_repo
+        self.delete_repo = delete_repo
+        self.size = max(0, int(os.getenv("REPO_POOL_SIZE", "0")))
+        self.max_age = float(os.getenv("REPO_POOL_MAX_AGE_SECONDS", "86400"))
+        self.refill_interval = float(os.getenv("REPO_POOL_REFILL_SECONDS", "30"))
+        # (repo, created timestamp), oldest first
+        self._ready: deque = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"created": 0, "adopted": 0, "claimed": 0, "misses": 0, "reclaimed": 0, "failures": 0}
+
+    def start(self):
+        if self.size <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="repo-pool", daemon=True)
+        self._thread.start()
+        logger.info(f"Repository pool filling to {self.size} repos")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def claim(self, name: str, description: str):
+        """Rename a pooled repo to `name` and return it, or None when the pool is empty"""
+        if self.size <= 0:
+            return None
+        with self._lock:
+            entry = self._ready.popleft() if self._ready else None
+            self.stats["misses" if entry is None else "claimed"] += 1
+        self._wake.set()
+        if entry is None:
+            return None
+        repo, created = entry
+        pool_name = repo.name
+        try:
+            repo.edit(name=name, description=description)
+        except Exception as e:
+            if getattr(e, "status", None) == 422:
+                # Name already taken: the repo is still a pool repo, keep it
+                with self._lock:
+                    self._ready.appendleft(entry)
+            else:
+                self.stats["failures"] += 1
+            logger.warning(f"Could not claim pooled repository {pool_name} as {name}: {e}")
+            return None
+        logger.info(f"Claimed pooled repository {pool_name} as {repo.name}")
+        return repo
+
+    def _run(self):
+        try:
+            self._adopt()
+        except Exception as e:
+            logger.error(f"Failed to list existing pool repositories: {e}")
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self._reclaim()
+                self._fill()
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.error(f"Repository pool refill failed: {e}")
+            self._wake.wait(self.refill_interval)
+
+    def _adopt(self):
+        """Take over pool repos left by an earlier process (extras beyond the pool size are deleted)"""
+        found = [
+            repo for repo in self.owner.get_repos()
+            if repo.name.startswith(POOL_PREFIX) and repo.description == POOL_DESCRIPTION
+        ]
+        found.sort(key=_created_ts)
+        for repo in found:
+            with self._lock:
+                keep = len(self._ready) < self.size
+                if keep:
+                    self._ready.append((repo, _created_ts(repo)))
+                    self.stats["adopted"] += 1
+            if not keep:
+                self.delete_repo(repo)
+                self.stats["reclaimed"] += 1
+        if found:
+            logger.info(f"Adopted {self.stats['adopted']} pooled repositories")
+
+    def _reclaim(self):
+        cutoff = time.time() - self.max_age
+        expired = []
+        with self._lock:
+            while self._ready and self._ready[0][1] < cutoff:
+                expired.append(self._ready.popleft()[0])
+        for repo in expired:
+            logger.info(f"Reclaiming unused pooled repository {repo.name}")
+            self.delete_repo(repo)
+            self.stats["reclaimed"] += 1
+
+    def _fill(self):
+        while not self._stop.is_set():
+            with self._lock:
+                if len(self._ready) >= self.size:
+                    return
+            name = f"{POOL_PREFIX}{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            repo = self.create_repo(name, POOL_DESCRIPTION)
+            with self._lock:
+                self._ready.append((repo, time.time()))
+                self.stats["created"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            ready = len(self._ready)
+        return {"size": self.size, "ready": ready, **self.stats}
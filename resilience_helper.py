@@ -0,0 +1,262 @@
+"""
+Resilience Helper Module for guarding calls to the LLM provider
+Circuit breaker over recent error rate and latency, plus jittered exponential retries that honour Retry-After.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Callable, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# HTTP statuses worth retrying besides 5xx
+RETRYABLE_STATUS = {408, 409, 429}
+
+# Rate limiting is back-pressure (honoured via Retry-After), not a provider fault
+RATE_LIMITED_STATUS = 429
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        """
+        Opens when at least LLM_BREAKER_MIN_CALLS of the last LLM_BREAKER_WINDOW
+        calls ran and LLM_BREAKER_ERROR_RATE of them failed or took longer than
+        LLM_BREAKER_SLOW_CALL_SECONDS. After LLM_BREAKER_OPEN_SECONDS it lets
+        LLM_BREAKER_HALF_OPEN_PROBES calls through; one good probe closes it.
+        """
+        self.name = name
+        self.window = max(1, int(os.getenv("LLM_BREAKER_WINDOW", "20")))
+        self.min_calls = max(1, int(os.getenv("LLM_BREAKER_MIN_CALLS", "5")))
+        self.error_rate = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+        self.slow_call = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "60"))
+        self.open_seconds = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+        self.half_open_probes = max(1, int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "1")))
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        # (ok, latency) of the most recent calls
+        self._calls: deque = deque(maxlen=self.window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self.stats = {"opened": 0, "rejected": 0, "successes": 0, "failures": 0}
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now (reserves a probe when half-open)"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.stats["rejected"] += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+                logger.info(f"Circuit {self.name} half-open, probing provider")
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.stats["rejected"] += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def is_open(self) -> bool:
+        """Open and still inside the cool-down, i.e. allow() would refuse"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds
+
+    def record_success(self, latency: float):
+        self._record(latency <= self.slow_call, latency)
+
+    def record_failure(self, latency: float):
+        self._record(False, latency)
+
+    def release(self):
+        """Give back a probe whose call ended without a verdict (cancelled or rate limited)"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def _record(self, ok: bool, latency: float):
+        with self._lock:
+            self.stats["successes" if ok else "failures"] += 1
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if ok:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    logger.info(f"Circuit {self.name} closed")
+                else:
+                    self._open()
+                return
+            self._calls.append((ok, latency))
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for call_ok, _ in self._calls if not call_ok)
+                if failures / len(self._calls) >= self.error_rate:
+                    self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        logger.warning(f"Circuit {self.name} opened; failing fast for {self.open_seconds:.1f}s")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self._calls)
+            failures = sum(1 for ok, _ in calls if not ok)
+            return {
+                "state": self.state,
+                "window_calls": len(calls),
+                "error_rate": round(failures / len(calls), 4) if calls else 0.0,
+                "avg_latency_ms": round(1000 * sum(lat for _, lat in calls) / len(calls), 2) if calls else 0.0,
+                **self.stats,
+            }
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay requested by the provider via retry-after-ms / Retry-After, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def _record_error(breaker: CircuitBreaker, error: Exception, latency: float):
+    if _status_code(error) == RATE_LIMITED_STATUS:
+        breaker.release()
+    else:
+        breaker.record_failure(latency)
+
+
+class RetryPolicy:
+    def __init__(self):
+        """
+        LLM_RETRY_ATTEMPTS total attempts per call with full-jitter exponential
+        backoff from LLM_RETRY_BASE_DELAY up to LLM_RETRY_MAX_DELAY seconds.
+        """
+        self.max_attempts = max(1, int(os.getenv("LLM_RETRY_ATTEMPTS", "3")))
+        self.base_delay = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+        self.max_delay = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+        self.stats = {"retries": 0, "gave_up": 0}
+
+    def should_retry(self, error: Exception) -> bool:
+        if isinstance(error, CircuitOpenError):
+            return False
+        status = _status_code(error)
+        if status is not None:
+            return status in RETRYABLE_STATUS or status >= 500
+        return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in (
+            "APIConnectionError", "APITimeoutError"
+        )
+
+    def backoff(self, attempt: int, error: Exception, remaining: Optional[float] = None) -> float:
+        """Provider Retry-After or jittered backoff, never above max_delay or the `remaining` budget"""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = min(retry_after, self.max_delay)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        return min(delay, remaining) if remaining is not None else delay
+
+    def _next_delay(self, attempt: int, error: Exception, started: float, budget: Optional[float]) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up"""
+        if attempt + 1 >= self.max_attempts or not self.should_retry(error):
+            return None
+        remaining = budget - (time.monotonic() - started) if budget is not None else None
+        delay = self.backoff(attempt, error, remaining)
+        # A wait that uses up the rest of the budget would leave no time for the retry itself
+        if remaining is not None and delay >= remaining:
+            self.stats["gave_up"] += 1
+            return None
+        self.stats["retries"] += 1
+        logger.warning(f"Retrying provider call in {delay:.2f}s (attempt {attempt + 2}/{self.max_attempts}): {error}")
+        return delay
+
+    def call(self, fn: Callable[[], Any], breaker: Optional[CircuitBreaker] = None, budget: Optional[float] = None):
+        """Run `fn` under the breaker, retrying transient errors within `budget` seconds"""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {breaker.name}")
+            call_started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                if breaker is not None:
+                    _record_error(breaker, e, time.monotonic() - call_started)
+                delay = self._next_delay(attempt, e, started, budget)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if breaker is not None:
+                breaker.record_success(time.monotonic() - call_started)
+            return result
+
+    async def acall(self, fn: Callable[[], Any], breaker: Optional[CircuitBreaker] = None, budget: Optional[float] = None):
+        """Async counterpart of call(); `fn` returns an awaitable"""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {breaker.name}")
+            call_started = time.monotonic()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                if breaker is not None:
+                    breaker.release()
+                raise
+            except Exception as e:
+                if breaker is not None:
+                    _record_error(breaker, e, time.monotonic() - call_started)
+                delay = self._next_delay(attempt, e, started, budget)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if breaker is not None:
+                breaker.record_success(time.monotonic() - call_started)
+            return result
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "max_delay": self.max_delay,
+            **self.stats,
+        }
@@ -0,0 +1,178 @@
+"""
+Scheduler Helper Module for fair sharing of pipeline capacity between tenants
+Weighted fair queuing keyed by tenant (request email) with per-tenant concurrency caps.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _parse_weights(raw: str) -> Dict[str, float]:
+    """Parse TENANT_WEIGHTS like "a@x.com=3,b@y.com=0.5" """
+    weights: Dict[str, float] = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        tenant, _, value = item.rpartition("=")
+        try:
+            weight = float(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid tenant weight: {item!r}")
+            continue
+        if tenant.strip() and weight > 0:
+            weights[tenant.strip().lower()] = weight
+    return weights
+
+
+class _TenantState:
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.last_finish = 0.0
+        self.queued = 0
+        self.running = 0
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        capacity: Optional[int] = None,
+        tenant_cap: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None
+    ):
+        """
+        capacity: total concurrent slots (JOB_WORKERS); tenant_cap: slots one
+        tenant may hold at once (TENANT_MAX_CONCURRENCY, 0 = no cap); weights:
+        share per tenant (TENANT_WEIGHTS, others get TENANT_DEFAULT_WEIGHT).
+        """
+        self.capacity = max(1, capacity or int(os.getenv("JOB_WORKERS", "32")))
+        self.tenant_cap = tenant_cap if tenant_cap is not None else int(os.getenv("TENANT_MAX_CONCURRENCY", "8"))
+        self.weights = weights if weights is not None else _parse_weights(os.getenv("TENANT_WEIGHTS", ""))
+        self.default_weight = float(os.getenv("TENANT_DEFAULT_WEIGHT", "1.0"))
+        self._tenants: Dict[str, _TenantState] = {}
+        # Tenants with nothing queued or running; dropped once the virtual clock passes their last finish tag
+        self._idle: Set[str] = set()
+        # (finish_tag, seq, start_tag, tenant, enqueued_at, future)
+        self._waiting: List[Tuple[float, int, float, str, float, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._running = 0
+
+    def _tenant(self, tenant: str) -> _TenantState:
+        state = self._tenants.get(tenant)
+        if state is None:
+            state = _TenantState(self.weights.get(tenant, self.default_weight))
+            self._tenants[tenant] = state
+        self._idle.discard(tenant)
+        return state
+
+    def _under_cap(self, state: _TenantState) -> bool:
+        return self.tenant_cap <= 0 or state.running < self.tenant_cap
+
+    async def acquire(self, tenant: str):
+        """Wait for a slot; tenants are served in order of their virtual finish tags"""
+        loop = asyncio.get_running_loop()
+        state = self._tenant(tenant)
+        start_tag = max(self._virtual_time, state.last_finish)
+        finish_tag = start_tag + 1.0 / state.weight
+        state.last_finish = finish_tag
+        state.queued += 1
+        future = loop.create_future()
+        heapq.heappush(self._waiting, (finish_tag, next(self._seq), start_tag, tenant, time.monotonic(), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just before cancellation: hand it back
+                self.release(tenant)
+            else:
+                state.queued -= 1
+                self._mark_if_idle(tenant, state)
+                self._drop_idle()
+            raise
+
+    def release(self, tenant: str):
+        state = self._tenants.get(tenant)
+        if state is not None:
+            state.running -= 1
+            self._mark_if_idle(tenant, state)
+        self._running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        deferred = []
+        while self._waiting and self._running < self.capacity:
+            item = heapq.heappop(self._waiting)
+            _, _, start_tag, tenant, enqueued_at, future = item
+            if future.cancelled():
+                continue
+            state = self._tenants[tenant]
+            if not self._under_cap(state):
+                deferred.append(item)
+                continue
+            waited = time.monotonic() - enqueued_at
+            state.queued -= 1
+            state.running += 1
+            state.dispatched += 1
+            state.total_wait += waited
+            state.max_wait = max(state.max_wait, waited)
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, start_tag)
+            future.set_result(None)
+        for item in deferred:
+            heapq.heappush(self._waiting, item)
+        self._drop_idle()
+
+    def _mark_if_idle(self, tenant: str, state: _TenantState):
+        if state.queued == 0 and state.running == 0:
+            self._idle.add(tenant)
+
+    def _drop_idle(self):
+        """
+        Forget idle tenants, so state and metrics stay bounded by the active
+        ones. A tenant whose last finish tag is still ahead of the virtual
+        clock is kept until the clock passes it: dropping it earlier would let
+        a tenant that just ran re-enter with a fresh tag and skip its turn.
+        Once every tenant is idle nobody is owed a turn, so all are dropped.
+        """
+        if self._running == 0 and len(self._idle) >= len(self._tenants):
+            self._virtual_time = max([self._virtual_time] + [state.last_finish for state in self._tenants.values()])
+        for tenant in list(self._idle):
+            state = self._tenants.get(tenant)
+            if state is not None and (state.queued or state.running):
+                self._idle.discard(tenant)
+            elif state is None or state.last_finish <= self._virtual_time:
+                self._tenants.pop(tenant, None)
+                self._idle.discard(tenant)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Per-tenant entries cover tenants with queued or running jobs (and recently idle ones)"""
+        tenants = {}
+        for tenant, state in self._tenants.items():
+            tenants[tenant] = {
+                "weight": state.weight,
+                "queued": state.queued,
+                "running": state.running,
+                "dispatched": state.dispatched,
+                "avg_wait_ms": round(1000 * state.total_wait / state.dispatched, 2) if state.dispatched else 0.0,
+                "max_wait_ms": round(1000 * state.max_wait, 2),
+            }
+        return {
+            "capacity": self.capacity,
+            "tenant_cap": self.tenant_cap,
+            "running": self._running,
+            "queued": sum(state.queued for state in self._tenants.values()),
+            "tenants": tenants,
+        }
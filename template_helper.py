@@ -0,0 +1,45 @@
+"""
+Template Helper Module for rendering deterministic builder and fallback pages
+Jinja2 templates from templates/ are compiled once per process and their bytecode is cached on disk.
+"""
+
+import os
+import logging
+from typing import Any
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+
+class TemplateHelper:
+    def __init__(self):
+        """
+        Bytecode is cached under TEMPLATE_CACHE_DIR (empty disables it). Inline
+        JavaScript in templates sits in {% raw %} blocks so `${...}`, `{#` and
+        `{{` in JS are never read as Jinja syntax.
+        """
+        bytecode_cache = None
+        cache_dir = os.getenv("TEMPLATE_CACHE_DIR", ".cache/jinja")
+        if cache_dir:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(cache_dir)
+            except OSError as e:
+                logger.warning(f"Template bytecode cache disabled: {e}")
+        self.env = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIR),
+            bytecode_cache=bytecode_cache,
+            autoescape=select_autoescape(["html"]),
+            # Compiled templates stay in memory; don't stat the files on every render
+            auto_reload=os.getenv("TEMPLATE_AUTO_RELOAD", "false").lower() == "true",
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+
+    def render(self, name: str, **context: Any) -> str:
+        return self.env.get_template(name).render(**context)
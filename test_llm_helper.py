@@ -0,0 +1,69 @@
+"""
+Tests for hedged generation in LLMHelper
+"""
+
+import asyncio
+
+from llm_helper import LLMHelper, GeneratedApp
+
+MESSAGES = [{"role": "system", "content": "system"}, {"role": "user", "content": "prompt"}]
+
+
+def _app() -> GeneratedApp:
+    return GeneratedApp(
+        html_content="<html><body><h1>ok</h1><script src='script.js'></script></body></html>",
+        css_content="h1{}",
+        js_content="console.log(1)",
+        metadata={},
+    )
+
+
+def test_race_models_passes_task_and_timeout_to_hedged_attempts(monkeypatch):
+    """Hedge attempts get the caller's provider timeout and task, not the hedge delay or an asyncio.Task"""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_CACHE_DIR", "")
+    monkeypatch.setenv("OPENAI_MODEL", "primary")
+    monkeypatch.setenv("OPENAI_HEDGE_MODELS", "backup")
+    monkeypatch.setenv("LLM_HEDGE_DELAY_SECONDS", "0.05")
+    helper = LLMHelper()
+    calls = []
+    app = _app()
+
+    async def fake_attempt(client, model, messages, task=None, timeout=None, *args):
+        calls.append((model, task, timeout))
+        # The primary is slower than the hedge delay, so the backup is started too
+        await asyncio.sleep(0.3 if model == "primary" else 0.01)
+        return model, "{}", app
+
+    monkeypatch.setattr(helper, "_attempt_model", fake_attempt)
+    asyncio.run(helper._race_models(None, MESSAGES, task="my-task", timeout=42.0))
+
+    assert calls == [("primary", "my-task", 42.0), ("backup", "my-task", 42.0)]
+    # The backup won, so its response is cached under its own model
+    assert helper.cache.get(helper._cache_key(MESSAGES, "backup")) == "{}"
+    assert helper.cache.get(helper._cache_key(MESSAGES)) is None
+
+
+def test_race_models_skips_hedge_when_no_provider_slot_is_free(monkeypatch):
+    """Hedge attempts share the LLM_MAX_CONCURRENCY slots; with none free the hedge is skipped, not queued"""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_CACHE_DIR", "")
+    monkeypatch.setenv("OPENAI_MODEL", "primary")
+    monkeypatch.setenv("OPENAI_HEDGE_MODELS", "backup")
+    monkeypatch.setenv("LLM_HEDGE_DELAY_SECONDS", "0.05")
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "1")
+    helper = LLMHelper()
+    calls = []
+    app = _app()
+
+    async def fake_attempt(client, model, *args):
+        calls.append((model, helper.inflight))
+        await asyncio.sleep(0.2)
+        return model, "{}", app
+
+    monkeypatch.setattr(helper, "_attempt_model", fake_attempt)
+    asyncio.run(helper._race_models(None, MESSAGES, task="my-task"))
+
+    assert calls == [("primary", 1)]
+    assert helper.model_stats["backup"]["skipped"] == 1
+    assert helper.inflight == 0
@@ -52,6 +52,19 @@ def test_module_imports():
         from llm_helper import LLMHelper
         from github_helper import GitHubHelper
         from deploy_helper import DeployHelper
+        from executor_helper import ExecutorHelper
+        from job_helper import JobHelper
+        from db_helper import DBHelper
+        from deadline_helper import Deadline
+        from admission_helper import AdmissionHelper
+        from scheduler_helper import FairScheduler
+        from cache_helper import ResponseCache
+        from resilience_helper import CircuitBreaker, RetryPolicy
+        from builder_helper import BuilderRegistry
+        from template_helper import TemplateHelper
+        from artifact_helper import ArtifactStore
+        from repo_pool_helper import RepoPool
+        from repo_index_helper import RepoIndex
         print("All custom modules can be imported")
         return True
     except ImportError as e: